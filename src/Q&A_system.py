@@ -1,50 +1,48 @@
 import streamlit as st
 
-from es_legal_query_utils import query_es_content  # 使用 query_es_content 函数
-from es_legal_query_utils import query_ollama  # 使用 query_es_content 函数
+from legal_query_utils import FEDERATED_INDICES, split_think_section, warm_up
+from metrics import start_metrics_server
+from qa_pipeline import answer_question  # 检索 + 上下文构建 + 答案缓存 + Ollama 生成（与压测工具共用）
 st.title("中国刑法问答系统")
 
-# 用户输入问题
-query = st.text_input("请输入您的法律问题：")
-
-if  st.button("查询"):
-    # 使用 query_es_content 函数进行查询
-    search_results = query_es_content(
-        index_name="crime_documents",  # Elasticsearch 索引名称
-        content_question=query,   #用户输入的问题 ,
-        top_k=20,  # 获取最多 10 条相关结果
-        min_score=10  # 最低评分阈值
-    )
-
-    if search_results:
-        # 构建上下文，包含文档标题层级和内容
-        context = "\n".join([
-            f"[文档{idx}] {doc.get('chapter_title', '')} - {doc.get('sections_title', '')} - {doc.get('subsections_title', '')} - {doc.get('article_title', '')}\n{doc['article_content']}"
-            for idx, doc in enumerate(search_results, 1)
-        ])[:4500]  # 简单截断，防止上下文过长
-    else:
-        context = "未找到相关法律信息。"
-
-
 
-    # 3. 执行Ollama查询
-    if context:
+@st.cache_resource
+def init_backend():
+    """进程内只执行一次：加载嵌入模型、建立 ES/Ollama 连接、启动 /metrics 端点，所有会话共享"""
+    start_metrics_server()
+    return warm_up(FEDERATED_INDICES)
 
-        print("\n生成回答中...")
-
-
-        result = query_ollama(
-            model="deepseek-r1:7b",
-            prompt=query,
-            context=context
-        )
-
-        # 解析结果
-        answer = result.get("message", {}).get("content", "未获得有效回答")
-        # 在界面显示回答
-        st.write(answer)
 
+# 应用启动时预热，首个问题不再因加载模型而变慢
+startup_timings = init_backend()
+st.sidebar.caption("启动耗时：" + "，".join(f"{name} {seconds:.2f}s" for name, seconds in startup_timings.items()))
 
+# 用户输入问题
+query = st.text_input("请输入您的法律问题：")
+# 流式输出：边生成边显示，首个 token 到达即可看到内容
+stream_answer = st.checkbox("流式显示回答", value=True)
+# 同时检索刑法与宪法（一次 _msearch 请求，得分归一化后合并）
+search_constitution = st.checkbox("同时检索宪法", value=False)
 
 
+def render_answer(text, think_placeholder, answer_placeholder):
+    """思考过程放入折叠区域，正式回答单独显示"""
+    thinking, answer = split_think_section(text)
+    if thinking:
+        think_placeholder.markdown(thinking)
+    answer_placeholder.markdown(answer)
 
+if  st.button("查询"):
+    # 在界面显示回答
+    with st.expander("思考过程", expanded=False):
+        think_placeholder = st.empty()
+    answer_placeholder = st.empty()
+
+    # 流式模式下每收到一个片段就刷新界面
+    result = answer_question(
+        query,
+        stream=stream_answer,
+        index_names=FEDERATED_INDICES if search_constitution else None,
+        on_chunk=lambda answer: render_answer(answer, think_placeholder, answer_placeholder)
+    )
+    render_answer(result["answer"], think_placeholder, answer_placeholder)
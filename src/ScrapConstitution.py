@@ -1,107 +1,35 @@
-import re
-import json
-import docx
 import os
+import sys
+import time
+import argparse
 from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModel
-from elasticsearch import Elasticsearch, helpers
-
-# 定义一个函数，从 DOCX 文件中读取所有文本
-def read_docx(file_path):
-    doc = docx.Document(file_path)
-    full_text = []
-    for para in doc.paragraphs:
-        if para.text.strip():  # 过滤掉空行
-            full_text.append(para.text.strip())
-    return "\n".join(full_text)
-
-# 从 "宪法.docx" 中获取法律文档字符串
-legal_document = read_docx("/home/eddie/script/law_ask_answer/llama3+ES_Python/Constitution.docx")
-
-# 加载中文向量模型
-model_path = "/home/eddie/Share_File/shibing624-text2vec-base-chinese"
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModel.from_pretrained(model_path)
-sentence_model = SentenceTransformer("shibing624/text2vec-base-chinese")
-
-# 定义正则表达式模式
-chapter_pattern = r"^(第[一二三四五六七八九十百千万]+章\s+.*)$|^(序\u3000\u3000言)$"#应该不可能到亿，注意在正则表达“|”代表“或”
-article_pattern = r"^(第[一二三四五六七八九十百千万]+条)\s+(.*)$"#应该不可能到亿
-
-# 将文档按行拆分
-lines = legal_document.splitlines()
-
-# 初始化法律文档的整体结构
-legal_json = {
-  
-    "chapters": []
-}
-
-current_chapter = None
-n=0
-# 遍历每一行，根据正则表达式判断是章节还是条文
-for line in lines:
-    line = line.strip()
-    if not line:
-        continue
-
-    # 如果匹配章节标题
-    
-    chapter_match = re.match(chapter_pattern, line)
-    if chapter_match:
-        current_chapter = {
-            "chapter_title": chapter_match.group(0) if line== "序\u3000\u3000言" else chapter_match.group(1),
-            "articles": []
-        }
-        legal_json["chapters"].append(current_chapter)
-        continue
-        
-        
-    if legal_json["chapters"] and legal_json["chapters"][-1]["chapter_title"] == "序\u3000\u3000言" and current_chapter is not None:
-          # 向量化条文内容
-        n=n+1
-        vector = sentence_model.encode(line).tolist()
-        article_entry = {
-             "article_number": "序言" + str(n), ##_id 不能重复否则上传后会覆盖ES
-            "content": line,
-            "vector": vector
-        }
-        current_chapter["articles"].append(article_entry)
-        continue
-
-    # 如果匹配条文
-    article_match = re.match(article_pattern, line)
-    if article_match and current_chapter is not None:
-        article_number = article_match.group(1)
-        content = article_match.group(2)
-        # 向量化条文内容
-        vector = sentence_model.encode(content).tolist()
-        article_entry = {
-            "article_number": article_number,
-            "content": content,
-            "vector": vector
-        }
-        current_chapter["articles"].append(article_entry)
-        continue
- 
-
-
-# 将法律文档保存为 JSON 文件
+from elasticsearch import Elasticsearch
+from index_mappings import DEFAULT_EF_CONSTRUCTION, DEFAULT_HNSW_M, constitution_index_body
+from corpus_snapshot import DEFAULT_SNAPSHOT_DIR, CorpusSnapshot, snapshot_path
+from ingest_pipeline import DEFAULT_BULK_THREADS, DEFAULT_CHUNK_SIZE, DEFAULT_EMBED_BATCH, ingest
+from statute_parser import iter_docx_lines, parse_constitution, tee_jsonl
+from onnx_embedding import EMBEDDING_BACKEND, OnnxSentenceModel, backend_model_id
+
+# "宪法.docx" 默认路径与目标索引
+DOCX_PATH = "/home/eddie/script/law_ask_answer/llama3+ES_Python/Constitution.docx"
+INDEX_NAME = 'constitution_documents'
+
+# 中文向量模型（按需加载）
+MODEL_NAME = "shibing624/text2vec-base-chinese"
+# 向量缓存与条文指纹使用的模型标识（随 EMBEDDING_BACKEND 变化）
+MODEL_ID = backend_model_id(MODEL_NAME)
+sentence_model = None
+
+
+def load_sentence_model():
+    global sentence_model
+    if sentence_model is None:
+        if EMBEDDING_BACKEND == "onnx":
+            sentence_model = OnnxSentenceModel()
+        else:
+            sentence_model = SentenceTransformer(MODEL_NAME)
+    return sentence_model
 
-# json_file_path = "宪法.json"
-# with open(json_file_path, 'w', encoding='utf-8') as f:
-#     json.dump(legal_json, f, ensure_ascii=False, indent=2)
-
-# 连接到 Elasticsearch
-es = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
-
-# 创建索引（如果不存在）
-index_name = 'constitution_documents'
-if not es.indices.exists(index=index_name):
-    es.indices.create(index=index_name)
-
-# 准备批量上传的数据
-actions = []
 
 # 定义文档元数据
 document_metadata = {
@@ -126,34 +54,94 @@ document_metadata = {
     ]
 }
 
-action1 = {
-            "_op_type": "index",
-            "_index": index_name,
-            "_id": "document_metadata",
-            "_source": {
-            
-                **document_metadata,  # 添加文档元数据
-            }
-        }
-actions.append(action1)
-# 遍历章节和条文，构建上传数据
-for chapter in legal_json["chapters"]:
-    for article in chapter["articles"]:
-        action = {
-            "_op_type": "index",
-            "_index": index_name,
-            "_id": f"{article['article_number']}", #_id 不能重复否则上传不了ES
-            "_source": {
-               
-                "chapter_title": chapter["chapter_title"],
-                "article_number": article["article_number"],
-                "content": article["content"],
-                "vector": article["vector"]
-            }
+
+def metadata_action(index_name):
+    """document_metadata 文档（每次上传都更新）"""
+    return {
+        "_op_type": "index",
+        "_index": index_name,
+        "_id": "document_metadata",
+        "_source": {
+            **document_metadata,  # 添加文档元数据
+            # 每次入库都会变化，查询端据此使检索结果缓存失效
+            "index_version": time.strftime("%Y-%m-%dT%H:%M:%S"),
         }
-        actions.append(action)
+    }
 
-# 批量上传数据到 Elasticsearch
-helpers.bulk(es, actions)
 
-print("数据已成功上传到 Elasticsearch。")
+def iter_article_sources(articles):
+    """将 statute_parser.parse_constitution 产出的条文记录转换为 (_id, 不含向量的 _source, {向量字段: 待编码文本})"""
+    for article in articles:
+        source = {
+            "chapter_title": article["chapter_title"],
+            "article_number": article["article_number"],
+            "content": article["content"],
+        }
+        yield f"{article['article_number']}", source, {"vector": article["content"]}  #_id 不能重复否则上传不了ES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析宪法 docx 并写入 Elasticsearch")
+    parser.add_argument("--docx", default=DOCX_PATH, help="宪法 docx 文件路径")
+    parser.add_argument("--index", default=INDEX_NAME, help="目标索引别名")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：只上传新增/修改的条文，并删除已废止的条文")
+    parser.add_argument("--quantize", action="store_true", help="向量字段使用 int8 量化的 HNSW 索引")
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M, help="HNSW 图每个节点的邻居数")
+    parser.add_argument("--ef-construction", type=int, default=DEFAULT_EF_CONSTRUCTION,
+                        help="HNSW 建图时的候选队列大小")
+    parser.add_argument("--local-index-dir", default="local_index",
+                        help="同时导出本地 NumPy 向量索引的目录（供 RETRIEVAL_BACKEND=local 使用），为空则不导出")
+    parser.add_argument("--legal-json", default="",
+                        help="同时保存解析出的条文记录（不含向量，每行一条）到该 JSON Lines 文件，为空则不保存")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR,
+                        help="同时写出语料快照（float32 向量矩阵 + 条文元数据）的目录，为空则不写")
+    parser.add_argument("--from-snapshot", action="store_true",
+                        help="直接从 --snapshot-dir 中的语料快照重建索引，不解析 docx、不编码")
+    parser.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH, help="每批编码的条文数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每个 bulk 请求的文档数")
+    parser.add_argument("--bulk-threads", type=int, default=DEFAULT_BULK_THREADS,
+                        help="并发 bulk 线程数（1 则使用 streaming_bulk）")
+    args = parser.parse_args()
+
+    snapshot_dir = snapshot_path(args.snapshot_dir, args.index)
+    if args.from_snapshot:
+        # 已编码的条文直接来自快照
+        snapshot = CorpusSnapshot.load(snapshot_dir)
+        snapshot.check_model(MODEL_ID)
+        pending, documents, snapshot_dir = None, snapshot.iter_documents(), None
+    else:
+        # 从 "宪法.docx" 中流式读取段落，逐条解析条文
+        articles = parse_constitution(iter_docx_lines(args.docx))
+        # 将条文记录保存为 JSON Lines 文件
+        if args.legal_json:
+            articles = tee_jsonl(articles, args.legal_json)
+        pending, documents = iter_article_sources(articles), None
+
+    # 连接到 Elasticsearch
+    es = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
+
+    # 条文逐批编码并流式写入 Elasticsearch
+    stats = ingest(
+        es, args.index, pending,
+        model_loader=load_sentence_model,
+        model_id=MODEL_ID,
+        index_body=constitution_index_body(quantize=args.quantize, m=args.hnsw_m, ef_construction=args.ef_construction),
+        metadata_action=metadata_action,
+        incremental=args.incremental,
+        local_index_path=os.path.join(args.local_index_dir, args.index) if args.local_index_dir else None,
+        local_vector_field="vector",
+        embed_batch=args.embed_batch,
+        chunk_size=args.chunk_size,
+        threads=args.bulk_threads,
+        snapshot_path=snapshot_dir,
+        documents=documents
+    )
+    if stats["failed"]:
+        print(f"{stats['failed']} 个文档上传失败，详见日志。")
+        sys.exit(1)
+    print("数据已成功上传到 Elasticsearch。")
+
+
+if __name__ == "__main__":
+    main()
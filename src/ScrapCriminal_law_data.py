@@ -1,212 +1,38 @@
-import re
-import json
-import docx
 import os
+import sys
+import time
+import argparse
 from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModel
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch
 import logging
+from hierarchy_index import HIERARCHY_INDEX, article_node_ids, collect_hierarchy, iter_hierarchy_sources
+from index_mappings import DEFAULT_EF_CONSTRUCTION, DEFAULT_HNSW_M, crime_index_body, hierarchy_index_body
+from corpus_snapshot import DEFAULT_SNAPSHOT_DIR, CorpusSnapshot, snapshot_path
+from ingest_pipeline import DEFAULT_BULK_THREADS, DEFAULT_CHUNK_SIZE, DEFAULT_EMBED_BATCH, ingest
+from statute_parser import iter_docx_lines, parse_criminal_law, tee_jsonl
+from onnx_embedding import EMBEDDING_BACKEND, OnnxSentenceModel, backend_model_id
+
+# "刑法.docx" 默认路径与目标索引
+DOCX_PATH = "/home/eddie/script/law_ask_answer/llama3+ES_Python/Criminal_Law.docx"
+INDEX_NAME = 'crime_documents'
+
+# 中文向量模型（按需加载：增量运行时若全部命中向量缓存则不加载模型）
+MODEL_NAME = "shibing624/text2vec-base-chinese"
+# 向量缓存与条文指纹使用的模型标识（随 EMBEDDING_BACKEND 变化）
+MODEL_ID = backend_model_id(MODEL_NAME)
+sentence_model = None
+
+
+def load_sentence_model():
+    global sentence_model
+    if sentence_model is None:
+        if EMBEDDING_BACKEND == "onnx":
+            sentence_model = OnnxSentenceModel()
+        else:
+            sentence_model = SentenceTransformer(MODEL_NAME)
+    return sentence_model
 
 
-def read_docx(file_path):
-    doc = docx.Document(file_path)
-    full_text = []
-    for para in doc.paragraphs:
-        if para.text.strip():  # 过滤掉空行
-            full_text.append(para.text.strip())
-    return "\n".join(full_text)
-
-
-# 从 "刑法.docx" 中获取法律文档字符串
-legal_document = read_docx("/home/eddie/script/law_ask_answer/llama3+ES_Python/Criminal_Law.docx")
-
-# 加载中文向量模型
-model_path = "/home/eddie/Share_File/shibing624-text2vec-base-chinese"
-tokenizer = AutoTokenizer.from_pretrained(model_path)
-model = AutoModel.from_pretrained(model_path)
-sentence_model = SentenceTransformer("shibing624/text2vec-base-chinese")
-
-# 定义正则表达式模式
-chapter_pattern = r"^(第[零一二三四五六七八九十百千万]+编)\s+(.*)$|^(附\u3000\u3000则)$"  # 匹配“总则”和“分则”
-section_pattern = r"^(第[零一二三四五六七八九十百千万]+章)\s+(.*)$"  # 匹配章
-subsection_pattern = r"^(第[零一二三四五六七八九十百千万]+节)\s+(.*)$"  # 匹配节
-article_pattern = r"^(第[零一二三四五六七八九十百千万]+条(?:[之零一二三四五六七八九十百千万]?)?)\s+(.*)$"  # article_pattern = r"^(第[零一二三四五六七八九十百千万]+条)\s+(.*)$"  # 匹配条文  [之零一二三四五六七八九十百千万]
-
-# 将文档按行拆分
-lines = legal_document.splitlines()
-
-# 初始化法律文档的整体结构
-legal_json = {
-    "chapter": []
-}
-
-current_chapter = None
-current_section = None
-current_subsection = None
-# line_number = 0
-# section_line_number = 0
-# subsection_line_number = 0
-# article_line_number = 0
-# max_section_line_number = 0
-# max_subsection_line_number=0
-# 用于保存当前内容的缓存
-content_buffer = []
-
-
-
-def save_buffer_to_current():
-    """Save buffered content to the most specific level (article, subsection, section, chapter)."""
-    global content_buffer
-
-    if content_buffer:
-        if current_subsection and current_subsection.get("article"):
-            # Save buffered content to the last article in the current subsection
-            current_subsection["article"][-1]["article_content"] = "\n".join(content_buffer)
-        elif current_section and current_section.get("article"):
-            # Save buffered content to the last article in the current section
-            current_section["article"][-1]["article_content"] = "\n".join(content_buffer)
-        elif current_chapter and current_chapter.get("article"):
-            # Save buffered content to the last article in the current chapter
-            current_chapter["article"][-1]["article_content"] = "\n".join(content_buffer)
-        elif current_subsection:
-            # If no articles, save to the subsection
-            current_subsection["content"] = "\n".join(content_buffer)
-        elif current_section:
-            # If no articles or subsections, save to the section
-            current_section["content"] = "\n".join(content_buffer)
-        elif current_chapter:
-            # If no articles, subsections, or sections, save to the chapter
-            current_chapter["content"] = "\n".join(content_buffer)
-
-        # Clear the buffer after saving
-        content_buffer.clear()
-
-
-# 更新后的内容解析逻辑
-for line in lines:
-    line = line.strip()
-    if not line:
-        continue
-
-    # Match chapter titles
-    chapter_match = re.match(chapter_pattern, line)
-    if chapter_match:
-        save_buffer_to_current()  # Save content before starting a new chapter
-        title_content = chapter_match.group(0) if line == "附\u3000\u3000则" else chapter_match.group(1)
-        title_content = title_content.replace("\u3000\u3000", "")
-        vector = sentence_model.encode(title_content).tolist()
-        current_chapter = {
-            "chapter_title": chapter_match.group(0) if line == "附\u3000\u3000则" else chapter_match.group(1),
-            "chapter_title_vector": vector,
-            "section": [],
-            "subsection": [],
-            "article": [],
-            "content": ""  # Save chapter-level content
-        }
-
-        legal_json["chapter"].append(current_chapter)
-        current_section = None
-        current_subsection = None
-        continue
-
-    # Match section titles
-    section_match = re.match(section_pattern, line)
-    if section_match and current_chapter is not None:
-        save_buffer_to_current()  # Save content before starting a new section
-        title_content = section_match.group(0)
-        vector = sentence_model.encode(title_content).tolist()
-        current_section = {
-            "sections_title": section_match.group(0),
-            "section_title_vector": vector,
-            "subsection": [],
-            "article": [],
-            "content": ""  # Save section-level content
-        }
-        current_chapter["section"].append(current_section)
-        current_subsection = None
-        continue
-
-    # Match subsection titles
-    subsection_match = re.match(subsection_pattern, line)
-    if subsection_match and current_section is not None:
-        save_buffer_to_current()  # Save content before starting a new subsection
-        title_content = subsection_match.group(0)
-        vector = sentence_model.encode(title_content).tolist()
-        current_subsection = {
-            "subsections_title": subsection_match.group(0),
-            "subsection_title_vector": vector,
-            "article": [],
-            "content": ""  # Save subsection-level content
-        }
-        current_section["subsection"].append(current_subsection)
-        continue
-
-    # Match articles
-    article_match = re.match(article_pattern, line)
-    if article_match:
-        save_buffer_to_current()  # Save buffered content to the previous article
-        article_number = article_match.group(1)
-        title = article_match.group(0)
-        vector = sentence_model.encode(title).tolist()
-
-        # Create a new article entry
-        article_entry = {
-            "article_number": article_number,
-            "article_title": title,
-            "article_title_vector": vector,
-            "article_content": "",  # Content will be populated later
-            "article_content_vector": ""
-        }
-        if current_subsection is not None:
-            current_subsection["article"].append(article_entry)
-        elif current_section is not None:
-            current_section["article"].append(article_entry)
-        elif current_chapter is not None:
-            current_chapter["article"].append(article_entry)
-        continue
-# Add lines to the content buffer
-    content_buffer.append(line)
-# Save the last buffered content to the last article
-if content_buffer:
-    if current_subsection and current_subsection.get("article"):
-        current_subsection["article"][-1]["article_content"] = "\n".join(content_buffer)
-    elif current_section and current_section.get("article"):
-        current_section["article"][-1]["article_content"] = "\n".join(content_buffer)
-    elif current_chapter and current_chapter.get("article"):
-        current_chapter["article"][-1]["article_content"] = "\n".join(content_buffer)
-    content_buffer.clear()
-
-
-def vectorize_articles(chapters):
-    for chapter in chapters:
-        for section in chapter.get("section", []):
-            for subsection in section.get("subsection", []):
-                for article in subsection.get("article", []):
-                    article["article_content_vector"] = sentence_model.encode(article["article_content"]).tolist()
-            for article in section.get("article", []):
-                article["article_content_vector"] = sentence_model.encode(article["article_content"]).tolist()
-        for article in chapter.get("article", []):
-            article["article_content_vector"] = sentence_model.encode(article["article_content"]).tolist()
-
-
-vectorize_articles(legal_json["chapter"])
-
-# Save the final JSON file
-json_file_path = "刑法.json"
-with open(json_file_path, 'w', encoding='utf-8') as f:
-    json.dump(legal_json, f, ensure_ascii=False, indent=2)
-
-# 连接到 Elasticsearch
-es = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
-
-# 创建索引（如果不存在）
-index_name = 'crime_documents'
-if not es.indices.exists(index=index_name):
-    es.indices.create(index=index_name)
-
-# 准备批量上传的数据
-actions = []
-
 # 定义文档元数据
 document_metadata = {
     "document_title": "中华人民共和国刑法",
@@ -275,97 +101,133 @@ document_metadata = {
         {"chapter": "第三编", "title": "附则", "subchapters": []}]}
 
 
-
-# 添加 document_metadata
-action1 = {
-    "_op_type": "index",
-    "_index": index_name,
-    "_id": "document_metadata",
-    "_source": {
-        **document_metadata,  # 添加文档元数据
-    }
-}
-
-actions.append(action1)
-
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# 遍历每个章节（包括附则部分）
-for chapter in legal_json["chapter"]:
-    # 处理章节级别的文章（如果有）
-    for article in chapter.get("article", []):
-        action = {
-            "_op_type": "index",
-            "_index": index_name,
-            "_id": f"{chapter['chapter_title']}_{article['article_number']}",
-            "_source": {
-                "chapter_title": chapter["chapter_title"],
-                "chapter_title_vector": chapter["chapter_title_vector"],
-
-                "sections_title": None,
-                "section_title_vector": None,
-                "subsections_title": None,
-                "subsection_title_vector": None,
-
-                "article_title": article["article_title"],
-                "article_content": article["article_content"],
-                "article_title_vector": article["article_title_vector"],
-                "article_content_vector": article["article_content_vector"],
-            }
+def iter_article_sources(articles):
+    """
+    将 statute_parser.parse_criminal_law 产出的条文记录转换为 (_id, 不含向量的 _source, {向量字段: 待编码文本})，
+    由 ingest_pipeline 分批编码
+    _id 直接使用条文编号（如“第十七条之一”），不随编/章/节标题变化，保证增量比对稳定
+    """
+    for article in articles:
+        source = {
+            "chapter_title": article["chapter_title"],
+            "sections_title": article["sections_title"],
+            "subsections_title": article["subsections_title"],
+            # 编/章/节 标题向量只在 crime_hierarchy 中保存一次，条文引用节点 id
+            **article_node_ids(article),
+
+            "article_number": article["article_number"],
+            "article_title": article["article_title"],
+            "article_content": article["article_content"],
         }
-        actions.append(action)
-
-    for section in chapter.get("section", []):
-        # 处理 section 中的文章
-        for article in section.get("article", []):
-            action = {
-                "_op_type": "index",
-                "_index": index_name,
-                "_id": f"{chapter['chapter_title']}_{section['sections_title']}_{article['article_number']}",
-                "_source": {
-                    "chapter_title": chapter["chapter_title"],
-                    "sections_title": section["sections_title"],
-                    "section_title_vector": section["section_title_vector"],
-                    "subsections_title": None,
-
-                    "article_title": article["article_title"],
-                    "article_content": article["article_content"],
-                    "article_title_vector": article["article_title_vector"],
-                    "article_content_vector": article["article_content_vector"],
-                }
-            }
-            actions.append(action)
-
-        # 处理 section 中的 subsection 和文章
-        for subsection in section.get("subsection", []):
-            for article in subsection.get("article", []):
-                action = {
-                    "_op_type": "index",
-                    "_index": index_name,
-                    "_id": f"{chapter['chapter_title']}_{section['sections_title']}_{subsection['subsections_title']}_{article['article_number']}",
-                    "_source": {
-                        "chapter_title": chapter["chapter_title"],
-                        "sections_title": section["sections_title"],
-                        "section_title_vector": section["section_title_vector"],
-                        "subsections_title": subsection["subsections_title"],
-                        "subsection_title_vector": subsection["subsection_title_vector"],
+        texts = {
+            "article_title_vector": article["article_title"],
+            "article_content_vector": article["article_content"]
+        }
+        yield article["article_number"], source, texts
+
+
+def metadata_action(index_name):
+    """添加 document_metadata（每次上传都更新）"""
+    return {
+        "_op_type": "index",
+        "_index": index_name,
+        "_id": "document_metadata",
+        "_source": {
+            **document_metadata,  # 添加文档元数据
+            # 每次入库都会变化，查询端据此使检索结果缓存失效
+            "index_version": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+    }
 
-                        "article_title": article["article_title"],
-                        "article_content": article["article_content"],
-                        "article_title_vector": article["article_title_vector"],
-                        "article_content_vector": article["article_content_vector"],
-                    }
-                }
-                actions.append(action)
 
-# 上传数据到 ES
-try:
-    success, failed = helpers.bulk(es, actions, raise_on_error=False)
-    logging.info(f"成功上传文档数: {success}")
-    if failed:
-        logging.warning(f"失败文档数: {len(failed)}")
-        for fail in failed:
-            logging.error(f"失败文档: {fail}")
-except Exception as e:
-    logging.error(f"批量上传失败: {e}")
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="解析刑法 docx 并写入 Elasticsearch")
+    parser.add_argument("--docx", default=DOCX_PATH, help="刑法 docx 文件路径")
+    parser.add_argument("--index", default=INDEX_NAME, help="目标索引别名")
+    parser.add_argument("--hierarchy-index", default=HIERARCHY_INDEX, help="编/章/节 标题向量所在的层级索引别名")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量模式：只上传新增/修改的条文，并删除已废止的条文")
+    parser.add_argument("--quantize", action="store_true", help="向量字段使用 int8 量化的 HNSW 索引")
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M, help="HNSW 图每个节点的邻居数")
+    parser.add_argument("--ef-construction", type=int, default=DEFAULT_EF_CONSTRUCTION,
+                        help="HNSW 建图时的候选队列大小")
+    parser.add_argument("--local-index-dir", default="local_index",
+                        help="同时导出本地 NumPy 向量索引的目录（供 RETRIEVAL_BACKEND=local 使用），为空则不导出")
+    parser.add_argument("--legal-json", default="",
+                        help="同时保存解析出的条文记录（不含向量，每行一条）到该 JSON Lines 文件，为空则不保存")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR,
+                        help="同时写出语料快照（float32 向量矩阵 + 条文元数据）的目录，为空则不写")
+    parser.add_argument("--from-snapshot", action="store_true",
+                        help="直接从 --snapshot-dir 中的语料快照重建索引，不解析 docx、不编码")
+    parser.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH, help="每批编码的条文数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每个 bulk 请求的文档数")
+    parser.add_argument("--bulk-threads", type=int, default=DEFAULT_BULK_THREADS,
+                        help="并发 bulk 线程数（1 则使用 streaming_bulk）")
+    args = parser.parse_args()
+
+    # 配置日志
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    snapshot_dir = snapshot_path(args.snapshot_dir, args.index)
+    hierarchy_snapshot_dir = snapshot_path(args.snapshot_dir, args.hierarchy_index)
+    hierarchy_nodes = {}
+    if args.from_snapshot:
+        # 已编码的条文与层级节点直接来自快照
+        snapshot = CorpusSnapshot.load(snapshot_dir)
+        hierarchy_snapshot = CorpusSnapshot.load(hierarchy_snapshot_dir)
+        snapshot.check_model(MODEL_ID)
+        hierarchy_snapshot.check_model(MODEL_ID)
+        pending, documents = None, snapshot.iter_documents()
+        hierarchy_pending, hierarchy_documents = None, hierarchy_snapshot.iter_documents()
+        snapshot_dir = hierarchy_snapshot_dir = None
+    else:
+        # 从 "刑法.docx" 中流式读取段落，逐条解析条文
+        articles = parse_criminal_law(iter_docx_lines(args.docx))
+        if args.legal_json:
+            articles = tee_jsonl(articles, args.legal_json)
+        # 条文流过时顺带收集 编/章/节 节点，条文写完后再写入层级索引
+        articles = collect_hierarchy(articles, hierarchy_nodes)
+        pending, documents = iter_article_sources(articles), None
+        # 生成器在条文写完后才开始读取 hierarchy_nodes
+        hierarchy_pending, hierarchy_documents = iter_hierarchy_sources(hierarchy_nodes), None
+
+    # 连接到 Elasticsearch
+    es = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
+
+    # 条文逐批编码并流式写入；全量重建写入新的版本化索引，完成后再把别名切换过去
+    stats = ingest(
+        es, args.index, pending,
+        model_loader=load_sentence_model,
+        model_id=MODEL_ID,
+        index_body=crime_index_body(quantize=args.quantize, m=args.hnsw_m, ef_construction=args.ef_construction),
+        metadata_action=metadata_action,
+        incremental=args.incremental,
+        local_index_path=os.path.join(args.local_index_dir, args.index) if args.local_index_dir else None,
+        local_vector_field="article_content_vector",
+        embed_batch=args.embed_batch,
+        chunk_size=args.chunk_size,
+        threads=args.bulk_threads,
+        snapshot_path=snapshot_dir,
+        documents=documents
+    )
+
+    # 层级索引只有几十个节点，每个标题编码一次
+    hierarchy_stats = ingest(
+        es, args.hierarchy_index, hierarchy_pending,
+        model_loader=load_sentence_model,
+        model_id=MODEL_ID,
+        index_body=hierarchy_index_body(quantize=args.quantize, m=args.hnsw_m, ef_construction=args.ef_construction),
+        metadata_action=metadata_action,
+        incremental=args.incremental,
+        embed_batch=args.embed_batch,
+        chunk_size=args.chunk_size,
+        threads=1,
+        snapshot_path=hierarchy_snapshot_dir,
+        documents=hierarchy_documents
+    )
+    if stats["failed"] or hierarchy_stats["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import itertools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 语义命中阈值（问题向量余弦相似度）与缓存容量，可通过环境变量覆盖
+DEFAULT_SIMILARITY_THRESHOLD = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.92"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+
+
+class SemanticAnswerCache:
+    """
+    语义答案缓存：保存 (问题向量, 检索到的条文 id, 索引版本, 生成的回答)
+    新问题与某条缓存的问题向量足够相似、且检索到的条文集合与索引版本都相同时，直接复用回答；
+    重新入库（条文内容可能变化）后索引版本改变，旧回答不再命中
+    """
+
+    def __init__(
+            self,
+            similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+            max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        # 条目 key -> (归一化问题向量, (索引版本, 条文 id 集合), 回答)，按最近使用排序
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # (索引版本, 条文 id 集合) -> 条目 key 集合，先按检索结果筛选，再比较向量
+        self._by_articles: Dict[tuple, set] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: Iterable[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else None
+
+    def lookup(self, question_vector: List[float], article_ids: Iterable[str], version: str = "") -> Optional[str]:
+        """查找可复用的回答，未命中返回 None"""
+        query = self._normalize(question_vector)
+        articles = (version, frozenset(article_ids))
+        with self._lock:
+            keys = list(self._by_articles.get(articles, ()))
+            if query is None or not keys:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([self._entries[key][0] for key in keys])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key = keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"语义答案缓存命中（相似度 {similarities[best]:.3f}）")
+            return self._entries[key][2]
+
+    def store(self, question_vector: List[float], article_ids: Iterable[str], answer: str, version: str = "") -> None:
+        vector = self._normalize(question_vector)
+        articles = (version, frozenset(article_ids))
+        if vector is None or not articles[1] or not answer:
+            return
+
+        with self._lock:
+            key = next(self._counter)
+            self._entries[key] = (vector, articles, answer)
+            self._by_articles.setdefault(articles, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (_, old_articles, _) = self._entries.popitem(last=False)
+                self._by_articles[old_articles].discard(old_key)
+                if not self._by_articles[old_articles]:
+                    del self._by_articles[old_articles]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# 进程内共享的答案缓存
+ANSWER_CACHE: Optional[SemanticAnswerCache] = None
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """获取（并缓存）进程内共享的语义答案缓存"""
+    global ANSWER_CACHE
+    if ANSWER_CACHE is None:
+        ANSWER_CACHE = SemanticAnswerCache()
+    return ANSWER_CACHE
@@ -0,0 +1,111 @@
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = {"零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_UNITS = {"十": 10, "百": 100, "千": 1000}
+_CN = "零〇一二两三四五六七八九十百千万"
+
+# 条文引用：“第二百三十二条”、“第232条”、“刑法232条”、“第一百三十三条之一”、“第133条之1”
+# 必须以“第”或法律名称开头，避免把“5条烟”、“3条问题”中的量词“条”当作条文引用
+CITATION_PATTERN = re.compile(
+    rf"(?:第|刑法|宪法)\s*(?:(?P<cn>[{_CN}]+)|(?P<num>\d+))\s*条"
+    rf"(?:\s*之\s*(?P<suffix>[{_CN}]+|\d+))?"
+)
+
+# 只引用条文时问题中允许出现的其余内容：法律名称、“是什么”之类的提问方式与标点
+CITATION_FILLER = re.compile(
+    r"中华人民共和国|刑法|宪法|规定了什么|规定的是什么|讲了什么|说了什么|是什么|什么|的内容|内容|的规定|规定|"
+    r"原文|全文|条文|请问|查询|查看|怎么说|讲的|说的|的|了|是|吗|呢|和|与|及|、|[\s《》“”\"'，,。.？?！!：:；;]"
+)
+
+# 一个问题最多置顶的条文数
+MAX_PINNED = 5
+
+ArticleKey = Tuple[int, int]
+
+
+def chinese_to_int(text: str) -> int:
+    """中文数字转整数（支持到“万”）：二百三十二 -> 232，十七 -> 17，一千零五 -> 1005"""
+    total = section = number = 0
+    for ch in text:
+        if ch in _DIGITS:
+            number = _DIGITS[ch]
+        elif ch in _UNITS:
+            section += (number or 1) * _UNITS[ch]
+            number = 0
+        elif ch == "万":
+            total += (section + number) * 10000
+            section = number = 0
+    return total + section + number
+
+
+def _to_int(text: str) -> int:
+    return int(text) if text.isdigit() else chinese_to_int(text)
+
+
+def article_key(match: "re.Match") -> ArticleKey:
+    """(条号, 之N)，没有“之N”时为 0"""
+    number = _to_int(match.group("cn") or match.group("num"))
+    suffix = _to_int(match.group("suffix")) if match.group("suffix") else 0
+    return number, suffix
+
+
+def parse_article_number(text: str) -> Optional[ArticleKey]:
+    """将条文编号（如“第一百三十三条之一”）解析为 (133, 1)，不是条文编号时返回 None"""
+    match = CITATION_PATTERN.fullmatch(unicodedata.normalize("NFKC", text).strip())
+    return article_key(match) if match else None
+
+
+def find_citations(question: str) -> List[ArticleKey]:
+    """按出现顺序返回问题中引用的条文（去重），全角数字按半角处理"""
+    keys = []
+    for match in CITATION_PATTERN.finditer(unicodedata.normalize("NFKC", question)):
+        key = article_key(match)
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def is_citation_only(question: str) -> bool:
+    """问题只是引用条文（如“第二百三十二条是什么”、“刑法第133条之一的内容”），没有其他需要检索的内容"""
+    text = unicodedata.normalize("NFKC", question)
+    if not CITATION_PATTERN.search(text):
+        return False
+    return not CITATION_FILLER.sub("", CITATION_PATTERN.sub("", text))
+
+
+class ArticleLookup:
+    """条文编号 -> 条文记录 的内存索引，用于直接引用条文的问题"""
+
+    def __init__(self):
+        self._articles: Dict[ArticleKey, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_records(cls, ids: Iterable[str], records: Iterable[Dict[str, Any]]) -> "ArticleLookup":
+        lookup = cls()
+        for doc_id, record in zip(ids, records):
+            lookup.add(doc_id, record)
+        return lookup
+
+    def add(self, doc_id: str, record: Dict[str, Any]) -> None:
+        key = parse_article_number(record.get("article_number") or doc_id)
+        if key is not None:
+            self._articles[key] = {"id": doc_id, **record}
+
+    def __len__(self) -> int:
+        return len(self._articles)
+
+    def find(self, question: str, limit: int = MAX_PINNED) -> List[Dict[str, Any]]:
+        """返回问题中引用、且索引中存在的条文记录（按引用顺序）"""
+        found = []
+        for key in find_citations(question):
+            article = self._articles.get(key)
+            if article is not None:
+                found.append(article)
+                if len(found) >= limit:
+                    break
+        return found
@@ -0,0 +1,176 @@
+import asyncio
+import atexit
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch
+
+from embedding_cache import normalize_text
+from legal_query_utils import (ES_HOSTS, RESULT_CACHE, build_lexical_clause, build_search_body,
+                               build_vector_clauses, generate_query_vector, get_index_version,
+                               load_hierarchy, process_search_results)
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# 向量编码是 CPU 密集的同步调用，放到线程池中执行，不阻塞事件循环
+EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="embed")
+
+ASYNC_ES: Optional[AsyncElasticsearch] = None
+# 后台事件循环：AsyncElasticsearch 的连接绑定在创建它的事件循环上，
+# 同步调用方（如 Streamlit）统一把协程提交到这个循环执行
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_async_es() -> AsyncElasticsearch:
+    """获取（并缓存）异步 ES 客户端，须在事件循环内调用"""
+    global ASYNC_ES
+    if ASYNC_ES is None:
+        ASYNC_ES = AsyncElasticsearch(
+            hosts=ES_HOSTS,
+            retry_on_timeout=True,
+            max_retries=3,
+            request_timeout=30
+        )
+    return ASYNC_ES
+
+
+def merge_responses(*responses: Dict) -> Dict:
+    """
+    合并文本检索与向量检索的结果：同一文档的得分相加（与 bool should 的求和语义一致），
+    返回与 es.search 结构相同的响应，便于复用 process_search_results
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for response in responses:
+        for hit in response.get("hits", {}).get("hits", []):
+            if hit["_id"] in merged:
+                merged[hit["_id"]]["_score"] += hit["_score"]
+            else:
+                merged[hit["_id"]] = dict(hit)
+
+    hits = sorted(merged.values(), key=lambda hit: hit["_score"], reverse=True)
+    return {"hits": {"hits": hits}}
+
+
+async def aquery_es_content(
+        index_name: str,
+        content_question: str,
+        top_k: int = 50,
+        min_score: float = 0.5,
+        ctx: Optional[contextvars.Context] = None
+) -> List[Dict[str, Any]]:
+    """
+    异步检索：
+    1. 文本检索立即发出
+    2. 同时在线程池中计算问题向量
+    3. 向量就绪后立即发出向量检索
+    两路结果按文档合并得分，总耗时接近最慢的一路而不是各阶段之和
+    ctx 为调用方的上下文（含当前问题的 trace），线程池中的编码耗时记入其中
+    """
+    results, _ = await _asearch(index_name, content_question, top_k, min_score, ctx)
+    return results
+
+
+async def _asearch(
+        index_name: str,
+        content_question: str,
+        top_k: int,
+        min_score: float,
+        ctx: Optional[contextvars.Context]
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """返回 (检索结果, 文本与向量两路是否都成功)；只有两路都成功的结果才可缓存"""
+    loop = asyncio.get_running_loop()
+    es = get_async_es()
+    ctx = ctx or contextvars.copy_context()
+
+    lexical_task = asyncio.create_task(es.search(
+        index=index_name,
+        body=build_search_body([build_lexical_clause(content_question)], top_k=top_k),
+        request_timeout=45
+    ))
+    # 层级索引的版本检查/加载是同步 ES 请求，与向量编码一起放到线程池中执行
+    query_vector, hierarchy = await asyncio.gather(
+        # 同一个 Context 不能在两个线程中同时进入，各用一份副本（共享同一个 trace 对象）
+        loop.run_in_executor(EMBED_EXECUTOR, ctx.copy().run, generate_query_vector, content_question),
+        loop.run_in_executor(EMBED_EXECUTOR, ctx.copy().run, load_hierarchy)
+    )
+
+    tasks = [lexical_task]
+    if query_vector:
+        tasks.append(asyncio.create_task(es.search(
+            index=index_name,
+            body=build_search_body(build_vector_clauses(query_vector, hierarchy), top_k=top_k),
+            request_timeout=45
+        )))
+
+    complete = bool(query_vector)
+    responses = []
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error(f"搜索失败: {str(result)}")
+            complete = False
+            continue
+        responses.append(result)
+    if not responses:
+        return [], False
+
+    return process_search_results(merge_responses(*responses), min_score), complete
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="es-async-loop", daemon=True).start()
+            atexit.register(close_async_es)
+    return _loop
+
+
+def close_async_es(timeout: float = 5.0) -> None:
+    """进程退出时在后台事件循环上关闭异步 ES 客户端（释放连接池）并停止循环，避免 Unclosed client session"""
+    global ASYNC_ES, _loop
+    with _loop_lock:
+        loop, client = _loop, ASYNC_ES
+        _loop = ASYNC_ES = None
+    if loop is None:
+        return
+    if client is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"异步 ES 客户端关闭失败: {str(e)}")
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def query_es_content_concurrent(
+        index_name: str,
+        content_question: str,
+        top_k: int = 50,
+        min_score: float = 0.5,
+        use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """aquery_es_content 的同步入口，与 query_es_content 共用检索结果缓存"""
+    cache_key = (normalize_text(content_question), index_name, top_k, min_score)
+    if use_cache:
+        version = get_index_version(index_name)
+        cached = RESULT_CACHE.get(cache_key, version)
+        if cached is not None:
+            return list(cached)
+
+    # 协程在后台事件循环线程中执行，传入调用方的上下文，编码耗时才能记入当前问题的 trace
+    future = asyncio.run_coroutine_threadsafe(
+        _asearch(index_name, content_question, top_k, min_score, contextvars.copy_context()),
+        _get_loop()
+    )
+    # 检索总耗时在调用方线程计入当前问题的 trace
+    with stage("search"):
+        results, complete = future.result()
+    # 任一路失败时结果只是部分排序，不缓存，避免在 TTL 内一直返回降级结果
+    if use_cache and complete and results:
+        RESULT_CACHE.put(cache_key, results, version)
+    return list(results)
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from article_lookup import is_citation_only
+from context_builder import build_context
+from legal_query_utils import (generate_query_vectors, lookup_cited_articles, msearch_es_content, query_ollama,
+                               split_think_section)
+from ollama_client import OLLAMA_MODEL
+from qa_pipeline import NO_RESULT_CONTEXT, with_pinned
+
+logger = logging.getLogger(__name__)
+
+
+def question_id(question: str) -> str:
+    """未指定 id 的问题按文本生成稳定 id，断点续跑时据此跳过已完成的问题"""
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path: str) -> List[Dict[str, str]]:
+    """
+    读取问题文件
+    - .jsonl：每行一个对象，含 question，可选 id
+    - 其他：每行一个问题
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                questions.append({"id": str(item.get("id") or question_id(item["question"])),
+                                  "question": item["question"]})
+            else:
+                questions.append({"id": question_id(line), "question": line})
+    return questions
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """已成功回答的问题 id（出错的问题在续跑时重试）"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时可能留下不完整的最后一行
+                continue
+            if not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def batches(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def answer_one(item: Dict[str, str], search_results: List[Dict[str, Any]], model: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    context = build_context(search_results) if search_results else NO_RESULT_CONTEXT
+    result = query_ollama(model=model, prompt=item["question"], context=context)
+
+    record = {"id": item["id"], "question": item["question"]}
+    if "message" in result:
+        thinking, answer = split_think_section(result["message"].get("content", ""))
+        record.update(answer=answer, thinking=thinking)
+    else:
+        record["error"] = result.get("error", "未获得有效回答")
+    record["articles"] = [
+        {"id": doc["id"], "score": doc["score"], "article_title": doc.get("article_title"),
+         "article_content": doc.get("article_content")}
+        for doc in search_results
+    ]
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(
+        questions: List[Dict[str, str]],
+        output_path: str,
+        index_name: str = "crime_documents",
+        batch_size: int = 32,
+        llm_parallel: int = 2,
+        top_k: int = 20,
+        min_score: float = 10,
+        model: str = OLLAMA_MODEL,
+        max_pending: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    批量问答
+    - 每批问题一次编码、一次 _msearch 检索；直接引用条文编号的问题另将引用的条文置于检索结果之前，
+      只引用条文的问题（如“第二百三十二条是什么”）直接使用引用的条文，不参与编码与检索
+    - LLM 生成在线程池中有界并发执行，下一批的检索与当前批的生成重叠；
+      已检索、待生成的问题最多 max_pending 个（默认两批），生成跟不上时检索暂停等待
+    - 每个回答完成即追加写入 JSONL 并刷新，中断后可续跑
+    """
+    done = completed_ids(output_path)
+    pending = [item for item in questions if item["id"] not in done]
+    logger.info(f"共 {len(questions)} 个问题，已完成 {len(questions) - len(pending)} 个，待处理 {len(pending)} 个")
+
+    stats = {"answered": 0, "errors": 0, "skipped": len(questions) - len(pending)}
+    write_lock = threading.Lock()
+    # 背压：每个已提交未完成的问题占一个名额（连同检索结果与上下文留在内存中）
+    in_flight = threading.BoundedSemaphore(max(max_pending or 2 * batch_size, llm_parallel))
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=llm_parallel, thread_name_prefix="llm") as executor:
+
+        def write(item: Dict[str, str], future) -> None:
+            try:
+                record = future.result()
+            except Exception as e:
+                # 记为失败并写入错误记录，续跑时重试
+                logger.error(f"生成失败: {item['id']}: {str(e)}")
+                record = {"id": item["id"], "question": item["question"], "error": str(e)}
+            finally:
+                in_flight.release()
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats["errors" if record.get("error") else "answered"] += 1
+
+        for batch in batches(pending, batch_size):
+            pinned = [lookup_cited_articles(index_name, item["question"]) for item in batch]
+            searched = [i for i, item in enumerate(batch) if not (pinned[i] and is_citation_only(item["question"]))]
+            texts = [batch[i]["question"] for i in searched]
+            results = {}
+            if texts:
+                vectors = generate_query_vectors(texts, batch_size=batch_size)
+                results = dict(zip(searched, msearch_es_content(index_name, texts, vectors, top_k=top_k,
+                                                                min_score=min_score)))
+            for i, item in enumerate(batch):
+                # 直接引用条文编号时，引用的条文置于检索结果之前；只引用条文时没有检索结果
+                search_results = with_pinned(pinned[i], results.get(i, []))
+                in_flight.acquire()
+                future = executor.submit(answer_one, item, search_results, model)
+                future.add_done_callback(lambda done, item=item: write(item, done))
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量问答：从文件读取问题，结果写入 JSONL（支持断点续跑）")
+    parser.add_argument("questions", help="问题文件（每行一个问题，或含 question/id 字段的 .jsonl）")
+    parser.add_argument("--output", default="answers.jsonl", help="输出 JSONL 文件（已存在时跳过已完成的问题）")
+    parser.add_argument("--index", default="crime_documents", help="检索的索引")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批编码与 _msearch 的问题数")
+    parser.add_argument("--llm-parallel", type=int, default=2, help="同时进行的 LLM 生成数（建议与 OLLAMA_NUM_PARALLEL 一致）")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="已检索、待生成的问题数上限（默认两批），生成跟不上时暂停检索")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--min-score", type=float, default=10)
+    parser.add_argument("--model", default=OLLAMA_MODEL)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = run_batch(
+        read_questions(args.questions),
+        args.output,
+        index_name=args.index,
+        batch_size=args.batch_size,
+        llm_parallel=args.llm_parallel,
+        max_pending=args.max_pending,
+        top_k=args.top_k,
+        min_score=args.min_score,
+        model=args.model
+    )
+    logger.info(f"完成: {stats}，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import ScrapConstitution
+import ScrapCriminal_law_data
+import embedding_cache
+from context_builder import build_context
+from embedding_utils import batch_encode
+from hierarchy_index import HierarchyIndex, collect_hierarchy, iter_hierarchy_sources
+from ingest_pipeline import embed_documents, index_actions
+from statute_parser import iter_docx_lines, parse_constitution, parse_criminal_law
+from legal_query_utils import SOURCE_FIELDS, build_chat_messages, build_es_query, process_search_results, \
+    split_think_section
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+CRIME_DOCX = os.path.join(DATA_DIR, "Criminal_Law.docx")
+CONSTITUTION_DOCX = os.path.join(DATA_DIR, "Constitution.docx")
+# 随仓库提交的基准（替代编码器、--repeat 20 生成），硬件差异较大时用 --update-baseline 在本机重新生成
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# 基准问题（用于构建查询与检索结果）
+QUESTIONS = ["故意杀人判几年", "正当防卫的条件", "未成年人犯罪如何处罚", "醉酒驾驶机动车", "贪污受贿的量刑标准"]
+
+# 模拟 Ollama 的回答（含 <think> 段），用于衡量提示词组装与回答拆分
+STAND_IN_ANSWER = "<think>\n" + "根据检索到的条文分析。" * 40 + "\n</think>\n" + "依照刑法第二百三十二条的规定。" * 20
+
+
+class StandInEncoder:
+    """
+    替代向量模型：按字符 bigram 哈希到固定维度并归一化，输出确定
+    每次 encode 调用有固定开销（模拟模型前向的调度成本），用于比较批量与逐条编码
+    """
+
+    def __init__(self, dims: int = 768, call_overhead: float = 0.0005):
+        self.dims = dims
+        self.call_overhead = call_overhead
+
+    def encode(self, sentences, batch_size: int = 64, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        time.sleep(self.call_overhead)
+
+        vectors = np.zeros((len(sentences), self.dims), dtype=np.float32)
+        for row, text in enumerate(sentences):
+            for i in range(max(len(text) - 1, 1)):
+                digest = hashlib.blake2b(text[i:i + 2].encode("utf-8"), digest_size=4).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dims] += 1.0
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors[0] if single else vectors
+
+
+def stand_in_search_response(documents: List[Dict[str, Any]], top_k: int, seed: int = 0) -> Dict:
+    """替代 ES：从条文中取 top_k 条，按 es.search 的响应结构返回（_source 只含 SOURCE_FIELDS）"""
+    rng = random.Random(seed)
+    sample = rng.sample(documents, min(top_k, len(documents)))
+    hits = [
+        {
+            "_index": "crime_documents",
+            "_id": doc_id,
+            "_score": rng.uniform(5.0, 40.0),
+            "_source": {field: source.get(field) for field in SOURCE_FIELDS}
+        }
+        for doc_id, source in sample
+    ]
+    hits.sort(key=lambda hit: hit["_score"], reverse=True)
+    return {"took": 1, "hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def time_stage(
+        func: Callable[[], Any],
+        items: int,
+        repeat: int,
+        warmup: int = 1,
+        inner: int = 1
+) -> Dict[str, float]:
+    """
+    多次运行 func，返回单次耗时的分位数（毫秒）与吞吐（条/秒）
+    耗时很短的阶段用 inner 在一次计时内连续运行多遍再取平均，降低计时噪声
+    与 timeit 一样，计时期间关闭垃圾回收
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(inner):
+                func()
+            timings.append((time.perf_counter() - start) / inner)
+    finally:
+        gc.enable()
+    timings.sort()
+    p50 = percentile(timings, 0.5)
+    return {
+        "runs": repeat,
+        "items": items,
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+        "throughput": round(items / p50, 1) if p50 else 0.0
+    }
+
+
+def run_benchmarks(repeat: int = 20, model=None, embed_sample: int = 128) -> Dict[str, Dict[str, float]]:
+    """
+    依次计时各阶段；ES 与 Ollama 使用本地替代，不需要任何外部服务
+    model 为 None 时使用 StandInEncoder
+    """
+    encoder = model or StandInEncoder()
+    results: Dict[str, Dict[str, float]] = {}
+
+    # 向量缓存写入临时文件，避免污染真实缓存
+    tmpdir = tempfile.mkdtemp(prefix="legal_bench_")
+    embedding_cache.EMBEDDING_CACHE = embedding_cache.EmbeddingCache(os.path.join(tmpdir, "embeddings.sqlite3"))
+
+    # 1. docx 流式读取与逐行解析
+    crime_lines = list(iter_docx_lines(CRIME_DOCX))
+    constitution_lines = list(iter_docx_lines(CONSTITUTION_DOCX))
+
+    results["read_docx.crime"] = time_stage(
+        lambda: list(iter_docx_lines(CRIME_DOCX)), len(crime_lines), repeat)
+    results["read_docx.constitution"] = time_stage(
+        lambda: list(iter_docx_lines(CONSTITUTION_DOCX)), len(constitution_lines), repeat)
+    results["parse.crime"] = time_stage(
+        lambda: list(parse_criminal_law(crime_lines)), len(crime_lines), repeat)
+    results["parse.constitution"] = time_stage(
+        lambda: list(parse_constitution(constitution_lines)), len(constitution_lines), repeat)
+
+    crime_articles = list(parse_criminal_law(crime_lines))
+    constitution_articles = list(parse_constitution(constitution_lines))
+
+    # 2. 向量编码：批量 vs 逐条
+    texts = [article["article_content"] for article in crime_articles][:embed_sample]
+    results["embed.batched"] = time_stage(
+        lambda: batch_encode(encoder, texts), len(texts), max(3, repeat // 5))
+    results["embed.single"] = time_stage(
+        lambda: [encoder.encode(text) for text in texts], len(texts), max(3, repeat // 5))
+
+    # 3. bulk 动作构建：条文转换、向量回填（计时前已写入向量缓存，计时部分均命中缓存）、指纹、action
+    def bulk_actions(scraper, index_name, articles):
+        documents = embed_documents(scraper.iter_article_sources(articles), lambda: encoder, scraper.MODEL_ID)
+        return [scraper.metadata_action(index_name)] + list(index_actions(index_name, documents))
+
+    crime_actions = bulk_actions(ScrapCriminal_law_data, "crime_documents", crime_articles)
+    constitution_actions = bulk_actions(ScrapConstitution, "constitution_documents", constitution_articles)
+    results["bulk_actions.crime"] = time_stage(
+        lambda: bulk_actions(ScrapCriminal_law_data, "crime_documents", crime_articles),
+        len(crime_actions) - 1, repeat)
+    results["bulk_actions.constitution"] = time_stage(
+        lambda: bulk_actions(ScrapConstitution, "constitution_documents", constitution_articles),
+        len(constitution_actions) - 1, repeat)
+    crime_documents = [(action["_id"], action["_source"]) for action in crime_actions[1:]]
+
+    # 4. 查询构建（含章标题相似度计算）、结果处理、上下文装配
+    hierarchy_nodes: Dict[str, Dict[str, Any]] = {}
+    list(collect_hierarchy(crime_articles, hierarchy_nodes))
+    hierarchy_titles = [text for _, _, fields in iter_hierarchy_sources(hierarchy_nodes) for text in fields.values()]
+    hierarchy = HierarchyIndex(list(hierarchy_nodes), [node["level"] for node in hierarchy_nodes.values()],
+                               batch_encode(encoder, hierarchy_titles))
+
+    query_vectors = [encoder.encode(question, normalize_embeddings=True).tolist() for question in QUESTIONS]
+    results["build_es_query"] = time_stage(
+        lambda: [build_es_query(q, v, top_k=20, min_score=10, hierarchy=hierarchy)
+                 for q, v in zip(QUESTIONS, query_vectors)],
+        len(QUESTIONS), repeat, inner=100)
+
+    responses = [stand_in_search_response(crime_documents, top_k=20, seed=seed) for seed in range(len(QUESTIONS))]
+    results["process_search_results"] = time_stage(
+        lambda: [process_search_results(response, min_score=10) for response in responses],
+        len(responses), repeat, inner=100)
+
+    search_results = [process_search_results(response, min_score=0) for response in responses]
+    results["build_context"] = time_stage(
+        lambda: [build_context(hits, count=len) for hits in search_results], len(search_results), repeat, inner=20)
+
+    contexts = [build_context(hits, count=len) for hits in search_results]
+    results["llm_io"] = time_stage(
+        lambda: [(build_chat_messages(q, c), split_think_section(STAND_IN_ANSWER))
+                 for q, c in zip(QUESTIONS, contexts)],
+        len(QUESTIONS), repeat, inner=100)
+
+    embedding_cache.EMBEDDING_CACHE.close()
+    embedding_cache.EMBEDDING_CACHE = None
+    return results
+
+
+def compare_with_baseline(
+        results: Dict[str, Dict[str, float]],
+        baseline: Dict[str, Dict[str, float]],
+        tolerance: float,
+        min_delta_ms: float = 0.05
+) -> List[str]:
+    """p50 超出基准 (1 + tolerance) 倍、且绝对差值超过 min_delta_ms 的阶段视为性能回退（亚毫秒级阶段的抖动不计）"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / previous["p50_ms"]
+        current["baseline_p50_ms"] = previous["p50_ms"]
+        current["ratio"] = round(ratio, 2)
+        if ratio > 1 + tolerance and current["p50_ms"] - previous["p50_ms"] > min_delta_ms:
+            regressions.append(f"{name}: p50 {current['p50_ms']}ms，基准 {previous['p50_ms']}ms（{ratio:.2f}x）")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]]) -> None:
+    print(f"{'stage':<28}{'items':>7}{'p50 ms':>11}{'p95 ms':>11}{'max ms':>11}{'items/s':>12}{'vs base':>9}")
+    for name, r in results.items():
+        ratio = f"{r['ratio']:.2f}x" if "ratio" in r else "-"
+        print(f"{name:<28}{r['items']:>7}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}{r['max_ms']:>11.3f}"
+              f"{r['throughput']:>12.1f}{ratio:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="离线微基准：入库与检索各阶段耗时（不依赖 ES / Ollama）")
+    parser.add_argument("--repeat", type=int, default=20, help="每个阶段的计时次数")
+    parser.add_argument("--embed-sample", type=int, default=128, help="编码基准使用的条文数")
+    parser.add_argument("--model", help="使用真实向量模型（text2vec 模型目录或名称）；默认使用替代编码器")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基准结果文件")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的 p50 退化比例")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="p50 绝对差值低于该值时不视为回退")
+    parser.add_argument("--update-baseline", action="store_true", help="将本次结果写为新的基准")
+    parser.add_argument("--require-baseline", action="store_true", help="基准文件不存在时以失败退出（用于 CI）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    # 被测模块会输出 INFO 日志（如上下文预算提示），基准运行时只保留警告
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    model = None
+    if args.model:
+        from text2vec import SentenceModel
+        model = SentenceModel(args.model)
+
+    results = run_benchmarks(repeat=args.repeat, model=model, embed_sample=args.embed_sample)
+
+    regressions = []
+    missing_baseline = False
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance, args.min_delta_ms)
+    else:
+        missing_baseline = True
+        logger.warning(f"基准文件 {args.baseline} 不存在，未做回退比较（可用 --update-baseline 生成）")
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_report(results)
+
+    if missing_baseline:
+        print(f"\n警告：基准文件 {args.baseline} 不存在，本次未做性能回退比较", file=sys.stderr)
+        if args.require_baseline:
+            return 2
+    if regressions:
+        print("\n性能回退：")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
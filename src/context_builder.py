@@ -0,0 +1,121 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 用于计算 token 数的分词器（应与 Ollama 中的模型一致）与上下文 token 预算
+LLM_TOKENIZER = os.environ.get("LLM_TOKENIZER", "deepseek-ai/DeepSeek-R1-Distill-Qwen-7B")
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))
+
+TOKENIZER_CACHE = None
+_tokenizer_unavailable = False
+
+
+def load_tokenizer():
+    """加载并缓存 LLM 分词器，加载失败时返回 None（改用字符数估算）"""
+    global TOKENIZER_CACHE, _tokenizer_unavailable
+    if TOKENIZER_CACHE is None and not _tokenizer_unavailable:
+        try:
+            from transformers import AutoTokenizer
+            TOKENIZER_CACHE = AutoTokenizer.from_pretrained(LLM_TOKENIZER)
+        except Exception as e:
+            logger.warning(f"分词器加载失败，按字符数估算 token: {str(e)}")
+            _tokenizer_unavailable = True
+    return TOKENIZER_CACHE
+
+
+def count_tokens(text: str) -> int:
+    """按 LLM 分词器计算 token 数；无分词器时按每个字符一个 token 估算（对中文偏保守）"""
+    tokenizer = load_tokenizer()
+    if tokenizer is None:
+        return len(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def _heading(doc: Dict[str, Any]) -> Tuple[str, ...]:
+    # 联合检索的结果带 law（法律名称），标题前加上出处
+    return tuple(
+        title for title in (doc.get("law"), doc.get("chapter_title"), doc.get("sections_title"),
+                            doc.get("subsections_title"))
+        if title
+    )
+
+
+def _article_text(doc: Dict[str, Any]) -> str:
+    title = doc.get("article_title") or doc.get("article_number") or ""
+    content = doc.get("article_content") or doc.get("content") or ""
+    return f"{title}\n{content}" if content else title
+
+
+def build_context(
+        results: List[Dict[str, Any]],
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        count: Optional[Callable[[str], int]] = None
+) -> str:
+    """
+    构建提示词上下文
+    - 去除重复条文（同一索引中相同 id，或相同条文标题）
+    - 按 编/章/节 分组，每组标题只输出一次
+    - 问题直接引用的条文（pinned）按引用顺序最先装入，其余按得分从高到低
+    - 贪心装入完整条文，放不下的条文整条跳过，不做截断
+    """
+    count = count or count_tokens
+
+    seen = set()
+    ranked = []
+    for doc in sorted(results, key=lambda d: (not d.get("pinned"), -(d.get("score") or 0))):
+        # 刑法与宪法的 id 都是“第X条”，联合检索时按 (索引, id) 区分
+        doc_id = (doc.get("index"), doc.get("id"))
+        key = (doc.get("law"), doc.get("article_title")) if doc.get("article_title") else doc_id
+        if doc_id in seen or key in seen:
+            continue
+        seen.update({doc_id, key})
+        ranked.append(doc)
+
+    # 编号在分组后才确定，前缀按可能的最大编号估算；换行与分组间的空行也计入预算
+    prefix_cost = count(f"[文档{len(ranked)}] ") + count("\n")
+    admitted: List[Tuple[Tuple[str, ...], str, Any]] = []
+    headings = set()
+    used = 0
+    skipped = []
+    for doc in ranked:
+        heading = _heading(doc)
+        block = _article_text(doc)
+        cost = count(block) + prefix_cost
+        if heading not in headings:
+            cost += count("【" + " - ".join(heading) + "】") + count("\n\n")
+        if used + cost > token_budget:
+            skipped.append(doc.get("id"))
+            continue
+        used += cost
+        headings.add(heading)
+        admitted.append((heading, block, doc.get("id")))
+
+    context = _render(admitted)
+    # 分词器按整段计数时可能与逐段估算略有出入，超出预算时从最后装入的条文开始去掉
+    while admitted and count(context) > token_budget:
+        skipped.append(admitted.pop()[2])
+        context = _render(admitted)
+
+    if skipped:
+        logger.info(f"上下文 token 预算 {token_budget} 已满，未装入 {len(skipped)} 条: {skipped}")
+    return context
+
+
+def _render(admitted: List[Tuple[Tuple[str, ...], str, Any]]) -> str:
+    """按 编/章/节 分组输出，条文依次编号为 [文档N]"""
+    groups: "OrderedDict[Tuple[str, ...], List[str]]" = OrderedDict()
+    for heading, block, _ in admitted:
+        groups.setdefault(heading, []).append(block)
+
+    sections = []
+    idx = 0
+    for heading, blocks in groups.items():
+        lines = ["【" + " - ".join(heading) + "】"] if heading else []
+        for block in blocks:
+            idx += 1
+            lines.append(f"[文档{idx}] {block}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
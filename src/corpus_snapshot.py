@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import NumpyVectorIndex, VectorRowWriter
+
+logger = logging.getLogger(__name__)
+
+# 语料快照：vectors.npy（float32 向量矩阵，可内存映射）+ documents.json（紧凑的条文元数据与向量行号）
+SNAPSHOT_VECTORS = "vectors.npy"
+SNAPSHOT_DOCUMENTS = "documents.json"
+SNAPSHOT_FORMAT = 1
+DEFAULT_SNAPSHOT_DIR = "snapshots"
+# 快照目录下每次写入一个版本子目录，CURRENT 记录当前版本名；替换 CURRENT（os.replace）即原子地切换快照
+CURRENT_FILE = "CURRENT"
+
+
+def tee_snapshot(
+        documents: Iterable[Tuple[str, Dict[str, Any]]],
+        directory: str,
+        model_id: str
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    透传已编码的 (_id, _source)，同时写入快照：向量逐行写入磁盘，内存中只保留元数据
+    全部文档流过后才替换快照；入库中途失败时丢弃写了一半的快照，原快照不受影响
+    """
+    writer = SnapshotWriter(directory, model_id)
+    finished = False
+    try:
+        for doc_id, source in documents:
+            writer.add(doc_id, source)
+            yield doc_id, source
+        writer.close()
+        finished = True
+    finally:
+        if not finished:
+            writer.abort()
+
+
+class SnapshotWriter:
+    """逐条写入语料快照：以 vector 结尾的字段写入向量矩阵，元数据中只记录其行号"""
+
+    def __init__(self, directory: str, model_id: str):
+        self.directory = os.path.abspath(directory)
+        self.model_id = model_id
+        self.staging = _make_staging(self.directory)
+        self.vectors = VectorRowWriter(os.path.join(self.staging, SNAPSHOT_VECTORS))
+        self.ids: List[str] = []
+        self.sources: List[Dict[str, Any]] = []
+        self.offsets: List[Dict[str, int]] = []
+
+    def add(self, doc_id: str, source: Dict[str, Any]) -> None:
+        metadata, fields = {}, {}
+        for key, value in source.items():
+            if key.endswith("vector"):
+                if value is not None:
+                    fields[key] = self.vectors.append(value)
+            else:
+                metadata[key] = value
+        self.ids.append(doc_id)
+        self.sources.append(metadata)
+        self.offsets.append(fields)
+
+    def close(self) -> None:
+        shape = self.vectors.close()
+        _write_documents(self.staging, self.model_id, shape, self.ids, self.sources, self.offsets)
+        _publish(self.staging, self.directory)
+        logger.info(f"语料快照已保存: {self.directory}（{len(self.ids)} 条，向量 {shape}）")
+
+    def abort(self) -> None:
+        self.vectors.abort()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class CorpusSnapshot:
+    """
+    已解析、已编码的语料快照：重建 ES 索引或本地向量索引时无需重新解析 docx 和编码
+    向量按入库时的原样保存（未归一化），与写入 ES 的向量一致
+    """
+
+    def __init__(
+            self,
+            ids: List[str],
+            sources: List[Dict[str, Any]],
+            offsets: List[Dict[str, int]],
+            vectors: np.ndarray,
+            model_id: str
+    ):
+        if len(ids) != len(sources) or len(ids) != len(offsets):
+            raise ValueError("ids、sources、offsets 数量不一致")
+        self.ids = ids
+        self.sources = sources
+        self.offsets = offsets
+        self.vectors = vectors
+        self.model_id = model_id
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def save(self, directory: str) -> None:
+        """
+        两个文件写入新的版本子目录后再切换 CURRENT，读取方不会拿到新旧文件混杂或不存在的快照
+        （documents.json 中另记录向量矩阵的形状，load 时校验）
+        """
+        directory = os.path.abspath(directory)
+        staging = _make_staging(directory)
+        vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+        np.save(os.path.join(staging, SNAPSHOT_VECTORS), vectors)
+        _write_documents(staging, self.model_id, vectors.shape, self.ids, self.sources, self.offsets)
+        _publish(staging, directory)
+        logger.info(f"语料快照已保存: {directory}（{len(self)} 条，向量 {self.vectors.shape}）")
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CorpusSnapshot":
+        """加载语料快照（CURRENT 指向的版本），mmap=True 时向量矩阵以只读方式内存映射"""
+        directory = _current_path(directory)
+        with open(os.path.join(directory, SNAPSHOT_DOCUMENTS), encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"不支持的快照格式: {data.get('format')}")
+        vectors = np.load(os.path.join(directory, SNAPSHOT_VECTORS), mmap_mode="r" if mmap else None)
+        if list(vectors.shape) != data["shape"]:
+            raise ValueError(f"快照向量矩阵形状 {vectors.shape} 与元数据记录的 {data['shape']} 不一致")
+        return cls(data["ids"], data["sources"], data["offsets"], vectors, data["model_id"])
+
+    def check_model(self, model_id: str) -> None:
+        """快照向量必须与当前编码模型一致，否则与查询向量不可比"""
+        if self.model_id != model_id:
+            raise ValueError(f"快照的编码模型 {self.model_id} 与当前模型 {model_id} 不一致")
+
+    def find_vectors(self, doc_id: str, fingerprint: str) -> Optional[Dict[str, List[float]]]:
+        """快照中同一条文、同一指纹（文本与模型都未变）的向量，没有时返回 None"""
+        if self._positions is None:
+            self._positions = {current_id: i for i, current_id in enumerate(self.ids)}
+        position = self._positions.get(doc_id)
+        if position is None or self.sources[position].get("fingerprint") != fingerprint:
+            return None
+        return {field: self.vectors[row].tolist() for field, row in self.offsets[position].items()}
+
+    def iter_documents(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """逐条产出 (_id, _source)，向量字段从矩阵中取回，可直接交给 ingest_pipeline 写入 ES"""
+        for doc_id, source, fields in zip(self.ids, self.sources, self.offsets):
+            yield doc_id, {**source, **{field: self.vectors[row].tolist() for field, row in fields.items()}}
+
+    def to_vector_index(self, vector_field: str) -> NumpyVectorIndex:
+        """由快照中的某个向量字段构建本地向量索引（行向量归一化）"""
+        positions = [i for i, fields in enumerate(self.offsets) if vector_field in fields]
+        rows = np.asarray([self.offsets[i][vector_field] for i in positions], dtype=np.int64)
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32).reshape(len(rows), -1)
+        return NumpyVectorIndex(
+            [self.ids[i] for i in positions],
+            np.ascontiguousarray(NumpyVectorIndex._normalize(vectors)),
+            [self.sources[i] for i in positions]
+        )
+
+
+def _make_staging(directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.mkdtemp(prefix=time.strftime("v%Y%m%d-%H%M%S-"), dir=directory)
+
+
+def _write_documents(
+        directory: str,
+        model_id: str,
+        shape: Tuple[int, ...],
+        ids: List[str],
+        sources: List[Dict[str, Any]],
+        offsets: List[Dict[str, int]]
+) -> None:
+    with open(os.path.join(directory, SNAPSHOT_DOCUMENTS), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": SNAPSHOT_FORMAT,
+            "model_id": model_id,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "shape": list(shape),
+            "ids": ids,
+            "sources": sources,
+            "offsets": offsets
+        }, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _current_version(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _current_path(directory: str) -> str:
+    """CURRENT 指向的版本目录；没有 CURRENT 时为快照目录本身（早期直接存放两个文件的布局）"""
+    version = _current_version(directory)
+    return os.path.join(directory, version) if version else directory
+
+
+def _publish(staging: str, directory: str) -> None:
+    """
+    原子地将 CURRENT 切换到写好的版本目录，再清理更早的版本与失败写入留下的目录
+    上一个版本保留到下次写入，正在读取它的进程不受影响；同一快照目录同时只应有一个写入方
+    """
+    previous = _current_version(directory)
+    version = os.path.basename(staging)
+    fd, pointer = tempfile.mkstemp(prefix=f".{CURRENT_FILE}-", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in (version, previous, CURRENT_FILE):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif name in (SNAPSHOT_VECTORS, SNAPSHOT_DOCUMENTS):
+            os.remove(path)
+
+
+def snapshot_exists(directory: Optional[str]) -> bool:
+    """目录中是否已有可读取的快照（写入中途的版本目录不算）"""
+    return bool(directory) and os.path.isfile(os.path.join(_current_path(directory), SNAPSHOT_DOCUMENTS))
+
+
+def snapshot_path(directory: Optional[str], index_name: str) -> Optional[str]:
+    """快照目录下按索引名存放，directory 为空时不写快照"""
+    return os.path.join(directory, index_name) if directory else None
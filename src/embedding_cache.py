@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 缓存文件位置与容量（条数），可通过环境变量覆盖
+DEFAULT_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "legal_qa", "embeddings.sqlite3")
+)
+DEFAULT_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：全角/半角统一，合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的持久化向量缓存
+    - 键：(模型标识, 归一化文本哈希)
+    - 值：float32 向量
+    - 超出容量时按最近访问时间淘汰
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model_id, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+    def get_many(self, model_id: str, texts: Iterable[str]) -> Dict[str, List[float]]:
+        """返回命中的 {原文本: 向量}，未命中的文本不出现在结果中"""
+        keys = {}
+        for text in texts:
+            keys.setdefault(text_key(text), []).append(text)
+        if not keys:
+            return {}
+
+        found = {}
+        hashes = list(keys)
+        with self._lock:
+            # SQLite 单条语句的参数个数有限，分块查询
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model_id = ? AND text_hash IN ({placeholders})",
+                    [model_id, *chunk]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    for text in keys[text_hash]:
+                        found[text] = vector.tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_access = ? WHERE model_id = ? AND text_hash = ?",
+                        [(time.time(), model_id, text_hash) for text_hash, _ in rows]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, model_id: str, items: Dict[str, List[float]]) -> None:
+        """写入 {文本: 向量}，并在超出容量时淘汰最久未访问的条目"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model_id, text_key(text), array("f", vector).tobytes(), now)
+            for text, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model_id, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+            logger.info(f"向量缓存超出容量，已淘汰 {overflow} 条")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 进程内共享的缓存实例
+EMBEDDING_CACHE: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取（并缓存）进程内共享的向量缓存"""
+    global EMBEDDING_CACHE
+    if EMBEDDING_CACHE is None:
+        EMBEDDING_CACHE = EmbeddingCache()
+    return EMBEDDING_CACHE
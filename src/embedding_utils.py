@@ -0,0 +1,61 @@
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+from embedding_cache import EmbeddingCache, get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# 每批编码的句子数（CPU 上 64 左右吞吐最好）
+DEFAULT_BATCH_SIZE = 64
+
+
+def batch_encode(
+        model,
+        texts: Iterable[str],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        **encode_kwargs
+) -> List[List[float]]:
+    """
+    批量编码文本，返回与输入顺序一致的向量列表
+    - 相同文本只编码一次
+    - 按长度排序后分批，减少同一批次内的 padding
+    """
+    texts = list(texts)
+    unique_texts = sorted(dict.fromkeys(texts), key=len)
+
+    vectors: Dict[str, List[float]] = {}
+    for start in range(0, len(unique_texts), batch_size):
+        batch = unique_texts[start:start + batch_size]
+        embeddings = model.encode(batch, batch_size=batch_size, **encode_kwargs)
+        for text, embedding in zip(batch, embeddings):
+            vectors[text] = embedding.tolist()
+
+    logger.info(f"批量编码完成: 输入 {len(texts)} 条, 实际编码 {len(unique_texts)} 条")
+    return [vectors[text] for text in texts]
+
+
+def cached_encode(
+        model_loader: Callable,
+        model_id: str,
+        texts: Iterable[str],
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        **encode_kwargs
+) -> List[List[float]]:
+    """
+    先查持久化向量缓存，只对未命中的文本调用模型
+    model_loader 仅在存在未命中文本时才被调用，全部命中时不加载模型
+    """
+    texts = list(texts)
+    cache = cache or get_embedding_cache()
+    vectors = cache.get_many(model_id, texts)
+
+    missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+    if missing:
+        encoded = batch_encode(model_loader(), missing, batch_size=batch_size, **encode_kwargs)
+        new_vectors = dict(zip(missing, encoded))
+        cache.put_many(model_id, new_vectors)
+        vectors.update(new_vectors)
+
+    logger.debug(f"向量缓存命中 {len(texts) - len(missing)}/{len(texts)}")
+    return [vectors[text] for text in texts]
@@ -0,0 +1,125 @@
+import logging
+import re
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 刑法 编/章/节 层级索引别名：每个节点只保存一次标题向量，条文通过 chapter_id/section_id/subsection_id 引用
+HIERARCHY_INDEX = "crime_hierarchy"
+LEVELS = ("chapter", "section", "subsection")
+# 条文记录中各层级对应的标题字段
+_TITLE_FIELDS = {"chapter": "chapter_title", "section": "sections_title", "subsection": "subsections_title"}
+_NODE_NUMBER = re.compile(r"第[零一二三四五六七八九十百千万]+[编章节]")
+
+
+def node_id(*titles: str) -> str:
+    """层级节点 id：各级标题编号组成的路径，如“第二编/第四章/第一节”；附则等无编号的标题去除空白后使用"""
+    parts = []
+    for title in titles:
+        match = _NODE_NUMBER.match(title)
+        parts.append(match.group() if match else "".join(title.split()))
+    return "/".join(parts)
+
+
+def article_node_ids(article: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """条文所属的 编/章/节 节点 id（没有章或节时为 None）"""
+    chapter, section, subsection = (article.get(_TITLE_FIELDS[level]) for level in LEVELS)
+    chapter_id = node_id(chapter) if chapter else None
+    section_id = node_id(chapter, section) if chapter_id and section else None
+    subsection_id = node_id(chapter, section, subsection) if section_id and subsection else None
+    return {"chapter_id": chapter_id, "section_id": section_id, "subsection_id": subsection_id}
+
+
+def collect_hierarchy(
+        articles: Iterable[Dict[str, Any]],
+        sink: Dict[str, Dict[str, Any]]
+) -> Iterator[Dict[str, Any]]:
+    """透传条文记录，同时按首次出现的顺序记录 编/章/节 节点：{节点 id: {level, title, parent_id}}"""
+    for article in articles:
+        parent_id = None
+        for level, current_id in zip(LEVELS, article_node_ids(article).values()):
+            if current_id is None:
+                break
+            if current_id not in sink:
+                sink[current_id] = {"level": level, "title": article[_TITLE_FIELDS[level]], "parent_id": parent_id}
+            parent_id = current_id
+        yield article
+
+
+def iter_hierarchy_sources(
+        nodes: Dict[str, Dict[str, Any]]
+) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, str]]]:
+    """层级节点转换为 (_id, 不含向量的 _source, {向量字段: 待编码文本})，由 ingest_pipeline 编码写入"""
+    for current_id, node in nodes.items():
+        # 与原条文中的编标题向量一致：“附　　则”去除全角空格后编码
+        yield current_id, dict(node), {"title_vector": node["title"].replace("\u3000\u3000", "")}
+
+
+class HierarchyIndex:
+    """编/章/节 标题向量的内存索引（几十个节点），查询时在进程内一次矩阵乘法得到全部相似度"""
+
+    def __init__(self, ids: List[str], levels: List[str], vectors: Optional["np.ndarray"] = None):
+        # numpy 按需导入，不拖慢 legal_query_utils 的导入
+        import numpy as np
+
+        self.ids = np.asarray(ids, dtype=object)
+        self.levels = np.asarray(levels, dtype=object)
+        if vectors is None or not len(ids):
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+        else:
+            matrix = np.asarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.vectors = matrix / norms
+
+    @classmethod
+    def from_hits(cls, hits: Iterable[Dict[str, Any]]) -> "HierarchyIndex":
+        """由层级索引的 hits 构建（层级索引的 _source 保留 title_vector），跳过 document_metadata"""
+        ids, levels, vectors = [], [], []
+        for hit in hits:
+            source = hit.get("_source", {})
+            if source.get("level") in LEVELS and source.get("title_vector"):
+                ids.append(hit["_id"])
+                levels.append(source["level"])
+                vectors.append(source["title_vector"])
+        return cls(ids, levels, vectors)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nearest(
+            self,
+            query_vector: List[float],
+            level: str,
+            top_n: int = 3,
+            min_similarity: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        """返回指定层级中与问题最相近的节点 [(节点 id, 余弦相似度)]"""
+        import numpy as np
+
+        mask = self.levels == level
+        if not len(self) or not mask.any():
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        similarities = self.vectors[mask] @ (query / norm)
+        ids = self.ids[mask]
+        order = np.argsort(-similarities)[:top_n]
+        return [(ids[i], float(similarities[i])) for i in order if similarities[i] >= min_similarity]
+
+
+def hierarchy_clauses(nearest: List[Tuple[str, float]], field: str, boost: float) -> List[Dict]:
+    """
+    将节点相似度传播到条文：每个相近节点一个 constant_score 子句，
+    得分与原先在条文上做标题向量 knn 时一致（cosine 的 _score 为 (1 + 相似度) / 2，再乘 boost）
+    """
+    return [
+        {"constant_score": {"filter": {"term": {field: current_id}}, "boost": boost * (1 + similarity) / 2}}
+        for current_id, similarity in nearest
+    ]
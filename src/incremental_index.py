@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+from typing import Dict, Iterable, Iterator, Tuple
+
+from elasticsearch import helpers
+
+logger = logging.getLogger(__name__)
+
+# 不参与差异比较、也不会被删除的文档
+RESERVED_IDS = ("document_metadata",)
+
+
+def document_fingerprint(source: Dict, model_id: str) -> str:
+    """
+    计算条文指纹：只看文本字段和向量模型标识
+    文本或模型任一变化都会导致指纹变化
+    """
+    text_fields = {k: v for k, v in source.items() if not k.endswith("vector") and k != "fingerprint"}
+    payload = json.dumps([model_id, text_fields], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def fetch_indexed_fingerprints(es, index_name: str) -> Dict[str, str]:
+    """读取索引中已有文档的 {_id: fingerprint}，索引不存在时返回空字典"""
+    if not es.indices.exists(index=index_name):
+        return {}
+
+    fingerprints = {}
+    for hit in helpers.scan(
+            es,
+            index=index_name,
+            query={"query": {"match_all": {}}, "_source": ["fingerprint"]}
+    ):
+        fingerprints[hit["_id"]] = hit.get("_source", {}).get("fingerprint")
+    return fingerprints
+
+
+def iter_diff_actions(
+        index_name: str,
+        documents: Iterable[Tuple[str, Dict]],
+        indexed: Dict[str, str],
+        stats: Dict[str, int]
+) -> Iterator[Dict]:
+    """
+    对比本次解析出的文档与索引中已有文档，只产出需要的 bulk 操作（新增/修改：index，已废止：delete）
+    逐条产出，stats 在迭代过程中原地更新；删除操作在全部文档比对完之后产出
+    """
+    seen = set()
+
+    for doc_id, source in documents:
+        seen.add(doc_id)
+        old_fingerprint = indexed.get(doc_id)
+        if old_fingerprint == source["fingerprint"]:
+            stats["unchanged"] += 1
+            continue
+        stats["added" if old_fingerprint is None and doc_id not in indexed else "changed"] += 1
+        yield {
+            "_op_type": "index",
+            "_index": index_name,
+            "_id": doc_id,
+            "_source": source
+        }
+
+    for doc_id in indexed:
+        if doc_id not in seen and doc_id not in RESERVED_IDS:
+            stats["deleted"] += 1
+            yield {
+                "_op_type": "delete",
+                "_index": index_name,
+                "_id": doc_id
+            }
+
+    logger.info(
+        f"增量比对结果: 新增 {stats['added']}, 修改 {stats['changed']}, "
+        f"未变 {stats['unchanged']}, 删除 {stats['deleted']}"
+    )
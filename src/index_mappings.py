@@ -0,0 +1,130 @@
+import logging
+import time
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# text2vec-base-chinese 输出维度
+VECTOR_DIMS = 768
+# HNSW 图参数默认值
+DEFAULT_HNSW_M = 16
+DEFAULT_EF_CONSTRUCTION = 100
+
+
+def dense_vector_field(
+        dims: int = VECTOR_DIMS,
+        quantize: bool = False,
+        m: int = DEFAULT_HNSW_M,
+        ef_construction: int = DEFAULT_EF_CONSTRUCTION
+) -> Dict:
+    """构建 dense_vector 字段映射（余弦相似度 + HNSW，可选 int8 量化存储）"""
+    return {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "cosine",
+        "index_options": {
+            "type": "int8_hnsw" if quantize else "hnsw",
+            "m": m,
+            "ef_construction": ef_construction
+        }
+    }
+
+
+def _index_body(
+        text_fields: List[str],
+        keyword_fields: List[str],
+        vector_fields: List[str],
+        vectors_in_source: bool = False,
+        **vector_options
+) -> Dict:
+    properties = {field: {"type": "text"} for field in text_fields}
+    properties.update({field: {"type": "keyword"} for field in keyword_fields})
+    properties.update({field: dense_vector_field(**vector_options) for field in vector_fields})
+    # document_metadata 中的目录结构只做存储，不建索引
+    properties["table_of_contents"] = {"type": "object", "enabled": False}
+
+    mappings: Dict = {"properties": properties}
+    if not vectors_in_source:
+        # 向量只用于检索，不写入 _source，减小存储和响应体积
+        mappings["_source"] = {"excludes": vector_fields}
+    return {
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 0
+        },
+        "mappings": mappings
+    }
+
+
+def crime_index_body(**vector_options) -> Dict:
+    """
+    刑法索引 crime_documents 的 settings/mappings
+    编/章/节 标题向量不再随每条条文重复保存，条文只引用 crime_hierarchy 中的节点 id
+    """
+    return _index_body(
+        text_fields=["chapter_title", "sections_title", "subsections_title", "article_title", "article_content"],
+        keyword_fields=["article_number", "fingerprint", "chapter_id", "section_id", "subsection_id"],
+        vector_fields=["article_title_vector", "article_content_vector"],
+        **vector_options
+    )
+
+
+def hierarchy_index_body(**vector_options) -> Dict:
+    """
+    刑法层级索引 crime_hierarchy 的 settings/mappings：每个 编/章/节 一个文档
+    节点只有几十个，查询端整体读入内存计算相似度，因此标题向量保留在 _source 中
+    """
+    return _index_body(
+        text_fields=["title"],
+        keyword_fields=["level", "parent_id", "fingerprint"],
+        vector_fields=["title_vector"],
+        vectors_in_source=True,
+        **vector_options
+    )
+
+
+def constitution_index_body(**vector_options) -> Dict:
+    """宪法索引 constitution_documents 的 settings/mappings"""
+    return _index_body(
+        text_fields=["chapter_title", "content"],
+        keyword_fields=["article_number", "fingerprint"],
+        vector_fields=["vector"],
+        **vector_options
+    )
+
+
+def create_versioned_index(es, alias: str, body: Dict) -> str:
+    """创建带版本号的新索引（如 crime_documents_v20250101120000），返回实际索引名"""
+    index_name = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}"
+    es.indices.create(index=index_name, body=body)
+    logger.info(f"已创建索引: {index_name}")
+    return index_name
+
+
+def swap_alias(es, alias: str, new_index: str, delete_old: bool = True) -> None:
+    """
+    将别名原子地切换到新索引
+    如果存在与别名同名的旧式索引（未使用别名时创建的），在同一个 update_aliases 请求中删除它并建立别名，
+    中间不会出现既没有索引也没有别名的空档；请求失败时旧索引保持不变
+    """
+    es.indices.refresh(index=new_index)
+
+    old_indices = []
+    actions = []
+    if es.indices.exists_alias(name=alias):
+        old_indices = list(es.indices.get_alias(name=alias).keys())
+        actions = [{"remove": {"index": index, "alias": alias}} for index in old_indices]
+    elif es.indices.exists(index=alias):
+        logger.warning(f"存在与别名同名的旧索引 {alias}，将删除后改用别名")
+        actions = [{"remove_index": {"index": alias}}]
+
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    logger.info(f"别名 {alias} 已指向 {new_index}")
+
+    if delete_old:
+        for index in old_indices:
+            if index != new_index:
+                es.indices.delete(index=index)
+                logger.info(f"已删除旧索引: {index}")
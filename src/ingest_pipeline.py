@@ -0,0 +1,210 @@
+import logging
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from elasticsearch import helpers
+
+from embedding_utils import cached_encode
+from incremental_index import document_fingerprint, fetch_indexed_fingerprints, iter_diff_actions
+from index_mappings import create_versioned_index, swap_alias
+
+logger = logging.getLogger(__name__)
+
+# 每批编码的条文数、每个 bulk 请求的文档数、并发 bulk 线程数
+DEFAULT_EMBED_BATCH = 64
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_BULK_THREADS = 2
+# 日志中最多列出的失败文档数
+MAX_REPORTED_ERRORS = 100
+
+# (_id, 不含向量的 _source, {向量字段: 待编码文本})
+PendingDocument = Tuple[str, Dict[str, Any], Dict[str, str]]
+
+
+def embed_documents(
+        pending: Iterable[PendingDocument],
+        model_loader: Callable,
+        model_id: str,
+        batch_size: int = DEFAULT_EMBED_BATCH,
+        known_vectors: Optional[Callable[[str, str], Optional[Dict[str, List[float]]]]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    按批编码条文并回填向量与指纹，逐条产出 (_id, _source)
+    只有下游取走当前批次后才编码下一批，内存中最多保留一批文档
+    指纹只取决于文本字段，在编码之前计算；known_vectors(_id, 指纹) 返回非 None 时（可以是空字典）
+    直接使用其中的向量，该条文不再编码
+    """
+    pending = iter(pending)
+    while True:
+        batch = list(islice(pending, batch_size))
+        if not batch:
+            return
+
+        to_encode = []
+        for doc_id, source, fields in batch:
+            source["fingerprint"] = document_fingerprint(source, model_id)
+            known = known_vectors(doc_id, source["fingerprint"]) if known_vectors else None
+            if known is None:
+                to_encode.append((source, fields))
+            else:
+                source.update(known)
+
+        texts = [text for _, fields in to_encode for text in fields.values()]
+        vectors = iter(cached_encode(model_loader, model_id, texts) if texts else [])
+        for source, fields in to_encode:
+            for field in fields:
+                source[field] = next(vectors)
+        for doc_id, source, _ in batch:
+            yield doc_id, source
+
+
+def index_actions(index_name: str, documents: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    for doc_id, source in documents:
+        yield {"_op_type": "index", "_index": index_name, "_id": doc_id, "_source": source}
+
+
+def bulk_index(
+        es,
+        actions: Iterable[Dict[str, Any]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        threads: int = DEFAULT_BULK_THREADS
+) -> Dict[str, Any]:
+    """
+    流式写入 ES，逐条检查结果
+    - threads > 1：parallel_bulk，编码（生成 actions）与 bulk 请求重叠；队列长度等于线程数，
+      ES 写入变慢时上游自动暂停（背压）
+    - threads = 1：streaming_bulk，429 时指数退避重试
+    返回成功/失败数与失败文档（最多 MAX_REPORTED_ERRORS 条）
+    """
+    if threads > 1:
+        results = helpers.parallel_bulk(
+            es, actions,
+            thread_count=threads,
+            chunk_size=chunk_size,
+            queue_size=threads,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+    else:
+        results = helpers.streaming_bulk(
+            es, actions,
+            chunk_size=chunk_size,
+            max_retries=3,
+            initial_backoff=1,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+
+    stats: Dict[str, Any] = {"succeeded": 0, "failed": 0, "errors": []}
+    for ok, item in results:
+        if ok:
+            stats["succeeded"] += 1
+            continue
+        stats["failed"] += 1
+        op_type, detail = next(iter(item.items()))
+        if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+            logger.error(f"文档写入失败: {op_type} {detail.get('_id')}: {detail.get('error')}")
+            stats["errors"].append({"op": op_type, "_id": detail.get("_id"), "error": detail.get("error")})
+
+    logger.info(f"成功写入文档数: {stats['succeeded']}，失败: {stats['failed']}")
+    return stats
+
+
+def ingest(
+        es,
+        alias: str,
+        pending: Optional[Iterable[PendingDocument]],
+        model_loader: Callable,
+        model_id: str,
+        index_body: Dict[str, Any],
+        metadata_action: Callable[[str], Dict[str, Any]],
+        incremental: bool = False,
+        local_index_path: Optional[str] = None,
+        local_vector_field: Optional[str] = None,
+        embed_batch: int = DEFAULT_EMBED_BATCH,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        threads: int = DEFAULT_BULK_THREADS,
+        snapshot_path: Optional[str] = None,
+        documents: Optional[Iterable[Tuple[str, Dict[str, Any]]]] = None
+) -> Dict[str, Any]:
+    """
+    入库流水线（刑法、宪法共用）：条文 -> 分批编码 -> bulk 写入，全程为生成器
+    - incremental 且别名已存在：只写入新增/修改的条文并删除已废止的条文
+    - 否则：写入新的版本化索引，全部成功后切换别名；有失败文档时保留旧索引不切换
+    local_index_path 非空时同时导出本地 NumPy 向量索引，snapshot_path 非空时同时写出语料快照
+    documents 为已编码的 (_id, _source)（如来自语料快照）时忽略 pending，不再编码
+    """
+    incremental = incremental and es.indices.exists(index=alias)
+    indexed = fetch_indexed_fingerprints(es, alias) if incremental else {}
+    if documents is None:
+        known_vectors = None
+        if incremental:
+            known_vectors = unchanged_vectors(indexed, snapshot_path, model_id,
+                                              need_vectors=bool(local_index_path or snapshot_path))
+        documents = embed_documents(pending, model_loader, model_id, batch_size=embed_batch,
+                                    known_vectors=known_vectors)
+    if snapshot_path:
+        from corpus_snapshot import tee_snapshot
+
+        documents = tee_snapshot(documents, snapshot_path, model_id)
+
+    if local_index_path:
+        from vector_store import tee_local_index
+
+        documents = tee_local_index(documents, local_index_path, local_vector_field)
+
+    if incremental:
+        # 增量模式：直接写入别名当前指向的索引
+        diff_stats = {"added": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+        actions = iter_diff_actions(alias, documents, indexed, diff_stats)
+        stats = bulk_index(es, _prepend(metadata_action(alias), actions), chunk_size=chunk_size, threads=threads)
+        stats["diff"] = diff_stats
+    else:
+        index_name = create_versioned_index(es, alias, index_body)
+        actions = index_actions(index_name, documents)
+        stats = bulk_index(es, _prepend(metadata_action(index_name), actions), chunk_size=chunk_size, threads=threads)
+        if stats["failed"]:
+            logger.error(f"{stats['failed']} 个文档写入失败，别名 {alias} 仍指向旧索引，新索引 {index_name} 保留待排查")
+        else:
+            swap_alias(es, alias, index_name)
+
+    return stats
+
+
+def unchanged_vectors(
+        indexed: Dict[str, str],
+        snapshot_path: Optional[str],
+        model_id: str,
+        need_vectors: bool
+) -> Callable[[str, str], Optional[Dict[str, List[float]]]]:
+    """
+    增量模式下未变条文（指纹与索引中一致）的向量来源，供 embed_documents 跳过编码
+    - 上次的语料快照中有同一指纹的向量时直接取用
+    - 不需要导出本地索引或快照时无需向量（iter_diff_actions 会跳过未变条文），返回空字典
+    - 否则返回 None，照常编码
+    """
+    from corpus_snapshot import CorpusSnapshot, snapshot_exists
+
+    previous = None
+    if snapshot_exists(snapshot_path):
+        try:
+            previous = CorpusSnapshot.load(snapshot_path)
+            previous.check_model(model_id)
+        except Exception as e:
+            logger.warning(f"上次的语料快照不可用，未变条文将重新编码: {str(e)}")
+            previous = None
+
+    def lookup(doc_id: str, fingerprint: str) -> Optional[Dict[str, List[float]]]:
+        if indexed.get(doc_id) != fingerprint:
+            return None
+        vectors = previous.find_vectors(doc_id, fingerprint) if previous is not None else None
+        if vectors is not None:
+            return vectors
+        return None if need_vectors else {}
+
+    return lookup
+
+
+def _prepend(first: Dict[str, Any], rest: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    yield first
+    yield from rest
@@ -1,17 +1,26 @@
-import requests
 import time
-import numpy as np  # 新增numpy用于处理向量
-import requests
+
+# 记录模块导入耗时（重量级依赖均延迟到首次使用时才导入）
+_IMPORT_START = time.perf_counter()
+
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch, helpers
-import logging
-from typing import List, Dict, Any, Optional, Tuple
-from huggingface_hub import snapshot_download
 import logging
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional, Sequence, Tuple
 import threading
-from text2vec import SentenceModel
+from article_lookup import MAX_PINNED, ArticleLookup
+from context_builder import load_tokenizer
+from embedding_utils import cached_encode
+from hierarchy_index import HIERARCHY_INDEX, HierarchyIndex, hierarchy_clauses
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from result_cache import ResultCache
+from embedding_cache import normalize_text
+from ollama_client import get_ollama_client
+from onnx_embedding import EMBEDDING_BACKEND, backend_model_id
+from metrics import record_stage, record_tokens, stage
+
+if TYPE_CHECKING:
+    from vector_store import NumpyVectorIndex
 
 # 配置日志记录
 logging.basicConfig(
@@ -22,114 +31,322 @@ logger = logging.getLogger(__name__)
 
 # 初始化模型（缓存提升性能）
 MODEL_CACHE = None
+MODEL_NAME = "/home/eddie/models/textmodel"
+# 查询向量在持久化缓存中的模型标识（与入库用的未归一化向量区分）
+QUERY_MODEL_ID = f"{backend_model_id(MODEL_NAME)}:normalized"
 
 
-def load_model(model_name: str = "/home/eddie/models/textmodel"):
-    """加载并缓存嵌入模型"""
+def load_model(model_name: str = MODEL_NAME):
+    """加载并缓存嵌入模型（EMBEDDING_BACKEND=onnx 时使用 ONNX Runtime 版本）"""
     global MODEL_CACHE
     if MODEL_CACHE is None:
-        logger.info(f"Loading sentence transformer model: {model_name}")
-        MODEL_CACHE = SentenceModel(model_name)
+        with stage("model_load"):
+            if EMBEDDING_BACKEND == "onnx":
+                from onnx_embedding import OnnxSentenceModel
+
+                logger.info("Loading ONNX sentence model")
+                MODEL_CACHE = OnnxSentenceModel()
+            else:
+                from text2vec import SentenceModel
+
+                logger.info(f"Loading sentence transformer model: {model_name}")
+                MODEL_CACHE = SentenceModel(model_name)
     return MODEL_CACHE
 
 
-# Elasticsearch 客户端配置
-es = Elasticsearch(
-    hosts=["http://localhost:9200"],
-    retry_on_timeout=True,
-    max_retries=3,
-    request_timeout=30
+# Elasticsearch 客户端配置（多个节点用逗号分隔），首次使用时创建
+ES_HOSTS = os.environ.get("ES_HOSTS", "http://localhost:9200").split(",")
+ES_CLIENT = None
+_es_lock = threading.Lock()
+
+
+def get_es_client():
+    """获取（并缓存）进程内共享的 Elasticsearch 客户端"""
+    global ES_CLIENT
+    with _es_lock:
+        if ES_CLIENT is None:
+            from elasticsearch import Elasticsearch
+
+            ES_CLIENT = Elasticsearch(
+                hosts=ES_HOSTS,
+                retry_on_timeout=True,
+                max_retries=3,
+                request_timeout=30
+            )
+    return ES_CLIENT
+
+
+# 检索结果缓存：相同问题在 TTL 内、且索引版本未变化时不再调用模型和 ES
+RESULT_CACHE = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("RESULT_CACHE_TTL", "600"))
 )
+# 索引版本的检查间隔（秒），避免每次查询都访问 ES
+INDEX_VERSION_CHECK_INTERVAL = 30
+_index_versions: Dict[str, Tuple[float, str]] = {}
+
+
+# 检索后端："es"（Elasticsearch 混合检索）、"es_async"（文本/向量检索并发执行）
+# 或 "local"（进程内 NumPy 向量检索，无需 ES）
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "es")
+# 本地向量索引目录（由入库脚本 --local-index-dir 导出），以及本地检索的余弦相似度下限
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", "local_index")
+# 本地索引不存在时改从语料快照构建
+CORPUS_SNAPSHOT_DIR = os.environ.get("CORPUS_SNAPSHOT_DIR", "snapshots")
+LOCAL_MIN_SIMILARITY = float(os.environ.get("LOCAL_MIN_SIMILARITY", "0.3"))
+# 本地后端联合检索时的余弦相似度下限：RRF 分只反映索引内的名次，各索引的第一名得分相同，
+# 合并前按问题与条文的向量相似度（绝对相关度）丢弃低相关结果，对应 ES 后端按原始得分的 min_score 过滤
+LOCAL_FEDERATED_MIN_SIMILARITY = float(os.environ.get("LOCAL_FEDERATED_MIN_SIMILARITY", "0.5"))
+LOCAL_INDEXES: Dict[str, Tuple["NumpyVectorIndex", LexicalIndex]] = {}
+
+# 层级索引：{索引名: (索引版本, HierarchyIndex)}
+HIERARCHY_INDEXES: Dict[str, Tuple[str, HierarchyIndex]] = {}
+# 条文编号索引：{索引名: (索引版本, ArticleLookup)}
+ARTICLE_LOOKUPS: Dict[str, Tuple[str, ArticleLookup]] = {}
+
+# 文本检索的字段权重（ES multi_match 与本地 BM25 共用）
+FIELD_WEIGHTS = {
+    "chapter_title": 1.2,
+    "sections_title": 1.5,
+    "subsections_title": 1.3,
+    "article_title": 1.7,
+    "article_content": 1.0
+}
+# 向量检索子句的权重（section_title_vector 为层级索引中章标题相似度传播到条文的权重）
+VECTOR_CONFIG = {
+    "section_title_vector": 0.6,
+    "article_title_vector": 0.7,
+    "article_content_vector": 0.8
+}
+# 与问题最相近的章节点数（只有这些章下的条文获得章标题相似度加分）
+HIERARCHY_TOP_SECTIONS = 3
+# 检索结果返回的字段
+SOURCE_FIELDS = ["chapter_title", "sections_title", "subsections_title", "article_title", "article_content"]
+# 字段结构不同的索引单独配置
+LEXICAL_FIELD_WEIGHTS = {
+    "constitution_documents": {"chapter_title": 1.2, "content": 1.0}
+}
+VECTOR_FIELDS = {
+    "constitution_documents": "vector"
+}
+# 联合检索的索引及其法律名称（写入结果，供上下文标注条文出处）
+FEDERATED_INDICES = ("crime_documents", "constitution_documents")
+LAW_NAMES = {"crime_documents": "刑法", "constitution_documents": "宪法"}
 
 
 def generate_query_vector(text: str) -> List[float]:
-    """生成查询向量（带异常处理）"""
+    """生成查询向量（带异常处理，重复问题直接命中持久化缓存）"""
     try:
-        model = load_model()
-        return model.encode(text, normalize_embeddings=True).tolist()
+        with stage("embed"):
+            return cached_encode(load_model, QUERY_MODEL_ID, [text], normalize_embeddings=True)[0]
     except Exception as e:
         logger.error(f"向量生成失败: {str(e)}")
         return []
 
 
-def build_es_query(
-        query: str,
-        query_vector: List[float],
-        top_k: int = 50,
-        min_score: float = 0.5
-) -> Dict:
+def generate_query_vectors(texts: List[str], batch_size: int = 64) -> List[List[float]]:
+    """批量生成查询向量：一次编码多个问题，已缓存的问题不再编码"""
+    try:
+        with stage("embed"):
+            return cached_encode(load_model, QUERY_MODEL_ID, texts, batch_size=batch_size,
+                                 normalize_embeddings=True)
+    except Exception as e:
+        logger.error(f"向量生成失败: {str(e)}")
+        return [[] for _ in texts]
+
+
+def build_lexical_clause(query: str, field_weights: Optional[Dict[str, float]] = None) -> Dict:
+    """文本检索子句：多字段 multi_match"""
+    return {
+        "multi_match": {
+            "query": query,
+            "fields": [f"{field}^{weight}" for field, weight in (field_weights or FIELD_WEIGHTS).items()],
+            "type": "best_fields",
+            "tie_breaker": 0.3
+        }
+    }
+
+
+def build_vector_clauses(query_vector: List[float], hierarchy: Optional[HierarchyIndex] = None) -> List[Dict]:
     """
-    构建 Elasticsearch 查询结构
+    向量检索子句：条文内容向量 knn + 章标题相似度
+    章标题向量只保存在层级索引中，在内存中与问题比较后按 section_id 传播到条文；
+    只构建查询、不做任何 I/O，hierarchy 由调用方通过 load_hierarchy() 取得后传入，为空时不附加章标题子句
     """
-    field_weights = {
-        "chapter_title": 1.2,
-        "sections_title": 1.5,
-        "subsections_title": 1.3,
-        "article_title": 1.7,
-        "article_content": 1.0
-    }
+    section_clauses = []
+    if hierarchy is not None:
+        section_clauses = hierarchy_clauses(
+            hierarchy.nearest(query_vector, "section", top_n=HIERARCHY_TOP_SECTIONS),
+            field="section_id",
+            boost=VECTOR_CONFIG["section_title_vector"]
+        )
+    return [
+        {
+            "knn": {
+                "field": "article_content_vector",
+                "query_vector": query_vector,
+                "num_candidates": 100,
+                "boost": VECTOR_CONFIG["article_content_vector"],
+                "similarity": 0.3  # 余弦相似度下限（索引映射为 cosine，取值范围 -1~1）
+            }
+        }
+    ] + section_clauses
 
-    vector_config = {
-        "section_title_vector": 0.6,
-        "subsection_title_vector": 0.5,
-        "article_title_vector": 0.7,
-        "article_content_vector": 0.8
-    }
 
+def build_search_body(
+        should: List[Dict],
+        top_k: int,
+        min_score: Optional[float] = None,
+        diagnostic: bool = False
+) -> Dict:
+    """
+    将若干 should 子句组装为完整的查询请求体
+    diagnostic=True 时附加 explain 和 profile，仅用于排查单个查询
+    """
     search_query = {
         "size": top_k,
         "query": {
             "bool": {
-                "should": [
-                    {
-                        "multi_match": {
-                            "query": query,
-                            "fields": [f"{field}^{weight}" for field, weight in field_weights.items()],
-                            "type": "best_fields",
-                            "tie_breaker": 0.3
-                        }
-                    },
-                    {
-                        "knn": {
-                            "field": "article_content_vector",
-                            "query_vector": query_vector,
-                            "num_candidates": 100,
-                            "boost": vector_config["article_content_vector"],
-                            "similarity": 30
-                        }
-                    }
-                    ,
-                    # 向量搜索：章节标题向量（新增）
-                    {
-                        "knn": {
-                            "field": "section_title_vector",
-                            "query_vector": query_vector,  # 需单独生成标题向量
-                            "num_candidates": 100,
-                            "boost": vector_config["section_title_vector"]
-                        }
-                    }
-                ],
+                "should": should,
                 "minimum_should_match": 1,
                 "boost": 1.0
             }
         },
-        "_source": ["chapter_title", "sections_title", "subsections_title", "article_title", "article_content"],
-        "min_score": min_score,
-        "explain": True
+        "_source": SOURCE_FIELDS
     }
+    if diagnostic:
+        search_query["explain"] = True
+        search_query["profile"] = True
+    if min_score is not None:
+        search_query["min_score"] = min_score
+    return search_query
+
+
+def build_es_query(
+        query: str,
+        query_vector: List[float],
+        top_k: int = 50,
+        min_score: float = 0.5,
+        diagnostic: bool = False,
+        hierarchy: Optional[HierarchyIndex] = None
+) -> Dict:
+    """
+    构建 Elasticsearch 查询结构
+    """
+    return build_search_body(
+        [build_lexical_clause(query)] + build_vector_clauses(query_vector, hierarchy),
+        top_k=top_k,
+        min_score=min_score,
+        diagnostic=diagnostic
+    )
+
+
+def build_index_query(
+        index_name: str,
+        query: str,
+        query_vector: List[float],
+        top_k: int = 50,
+        min_score: float = 0.5,
+        hierarchy: Optional[HierarchyIndex] = None
+) -> Dict:
+    """按索引的字段结构构建查询：刑法索引同 build_es_query，宪法等索引使用各自的文本字段与向量字段"""
+    if index_name not in VECTOR_FIELDS:
+        return build_es_query(query, query_vector, top_k=top_k, min_score=min_score, hierarchy=hierarchy)
 
+    field_weights = LEXICAL_FIELD_WEIGHTS[index_name]
+    search_query = build_search_body(
+        [
+            build_lexical_clause(query, field_weights),
+            {
+                "knn": {
+                    "field": VECTOR_FIELDS[index_name],
+                    "query_vector": query_vector,
+                    "num_candidates": 100,
+                    "boost": VECTOR_CONFIG["article_content_vector"],
+                    "similarity": 0.3
+                }
+            }
+        ],
+        top_k=top_k,
+        min_score=min_score
+    )
+    search_query["_source"] = list(field_weights) + ["article_number"]
     return search_query
 
 
+def load_hierarchy(index_name: str = HIERARCHY_INDEX) -> HierarchyIndex:
+    """
+    加载并缓存刑法层级索引（编/章/节 标题向量，几十个节点），索引版本变化后重新加载
+    会访问 ES（版本检查与首次加载），由检索入口调用后传给查询构建函数；warm_up 时预先加载
+    层级索引不存在或加载失败时缓存空索引，查询不再附加章标题子句
+    """
+    version = get_index_version(index_name)
+    cached = HIERARCHY_INDEXES.get(index_name)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    try:
+        from elasticsearch import helpers
+
+        hierarchy = HierarchyIndex.from_hits(helpers.scan(
+            get_es_client(),
+            index=index_name,
+            query={"query": {"match_all": {}}, "_source": ["level", "title_vector"]}
+        ))
+        logger.info(f"层级索引已加载: {index_name}（{len(hierarchy)} 个节点）")
+    except Exception as e:
+        logger.warning(f"层级索引加载失败: {str(e)}")
+        hierarchy = HierarchyIndex([], [])
+    HIERARCHY_INDEXES[index_name] = (version, hierarchy)
+    return hierarchy
+
+
+def corpus_version(index_names: Sequence[str]) -> str:
+    """一个或多个索引的版本（用作答案缓存的 key）；本地后端的索引在进程内只加载一次，版本固定"""
+    if RETRIEVAL_BACKEND == "local":
+        return "local"
+    return "|".join(get_index_version(index_name) for index_name in index_names)
+
+
+def get_index_version(index_name: str) -> str:
+    """
+    获取索引当前版本：别名指向的实际索引名 + 入库时写入 document_metadata 的 index_version
+    全量重建（切换别名）或增量更新后版本都会变化
+    """
+    now = time.monotonic()
+    cached = _index_versions.get(index_name)
+    if cached and now - cached[0] < INDEX_VERSION_CHECK_INTERVAL:
+        return cached[1]
+
+    try:
+        doc = get_es_client().get(index=index_name, id="document_metadata", _source_includes=["index_version"])
+        version = f"{doc['_index']}:{doc['_source'].get('index_version', '')}"
+    except Exception as e:
+        logger.warning(f"获取索引版本失败: {str(e)}")
+        version = "unknown"
+    _index_versions[index_name] = (now, version)
+    return version
+
+
 def query_es_content(
         index_name: str,
         content_question: str,
         top_k: int = 50,
-        min_score: float = 0.5
+        min_score: float = 0.5,
+        use_cache: bool = True
 ) -> List[Dict[str, Any]]:
     """
     执行 Elasticsearch 查询，返回结果
+    use_cache=True 时先查结果缓存（按归一化问题、索引名、top_k、min_score 区分）
     """
+    cache_key = (normalize_text(content_question), index_name, top_k, min_score)
+    if use_cache:
+        version = get_index_version(index_name)
+        cached = RESULT_CACHE.get(cache_key, version)
+        if cached is not None:
+            logger.info(f"检索结果缓存命中: {content_question}")
+            return list(cached)
+
     query_vector = generate_query_vector(content_question)
     if not query_vector:
         return []
@@ -138,33 +355,335 @@ def query_es_content(
         query=content_question,
         query_vector=query_vector,
         top_k=top_k,
-        min_score=min_score
+        min_score=min_score,
+        hierarchy=load_hierarchy()
     )
 
     try:
         logger.info(f"Executing search on index: {index_name}")
-        response = es.search(
-            index=index_name,
-            body=search_query,
-            request_timeout=45
-        )
+        with stage("search"):
+            response = get_es_client().search(
+                index=index_name,
+                body=search_query,
+                request_timeout=45
+            )
         logger.debug(f"Search completed in {response['took']}ms")
     except Exception as e:
         logger.error(f"搜索失败: {str(e)}")
         return []
 
-    return process_search_results(response, min_score)
+    with stage("post_process"):
+        results = process_search_results(response, min_score)
+    if use_cache:
+        RESULT_CACHE.put(cache_key, results, version)
+    return list(results)
+
+
+def msearch_es_content(
+        index_name: str,
+        questions: List[str],
+        query_vectors: List[List[float]],
+        top_k: int = 50,
+        min_score: float = 0.5
+) -> List[List[Dict[str, Any]]]:
+    """
+    一次 _msearch 请求检索多个问题，返回与 questions 顺序一致的结果列表
+    单个问题失败（或缺少向量）时对应位置为空列表，不影响其他问题
+    """
+    searches = []
+    positions = []
+    hierarchy = load_hierarchy()
+    for i, (question, vector) in enumerate(zip(questions, query_vectors)):
+        if not vector:
+            continue
+        searches.append({"index": index_name})
+        searches.append(build_es_query(question, vector, top_k=top_k, min_score=min_score, hierarchy=hierarchy))
+        positions.append(i)
+
+    results: List[List[Dict[str, Any]]] = [[] for _ in questions]
+    if not searches:
+        return results
+
+    try:
+        with stage("search"):
+            response = get_es_client().msearch(searches=searches, request_timeout=120)
+    except Exception as e:
+        logger.error(f"批量搜索失败: {str(e)}")
+        return results
+
+    with stage("post_process"):
+        for position, item in zip(positions, response["responses"]):
+            if "error" in item:
+                logger.error(f"搜索失败: {questions[position]}: {item['error']}")
+                continue
+            results[position] = process_search_results(item, min_score)
+    return results
+
+
+def scale_to_max(per_index: List[List[Dict[str, Any]]]) -> None:
+    """
+    各索引的得分统一除以所有索引中的最高分（原始得分保留在 raw_score）
+    不按索引分别归一化：那样每个索引的第一名都记为 1，与其绝对相关度无关
+    """
+    high = max((doc["score"] for results in per_index for doc in results), default=0.0)
+    for results in per_index:
+        for doc in results:
+            doc["raw_score"] = doc["score"]
+            doc["score"] = doc["score"] / high if high > 0 else 0.0
+
+
+def federated_search(
+        index_names: Sequence[str],
+        content_question: str,
+        top_k: int = 50,
+        min_score: float = 0.5,
+        backend: Optional[str] = None,
+        use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    多索引联合检索（如刑法 + 宪法）
+    - 问题只编码一次；ES 后端将各索引的查询合并为一个 _msearch 请求，本地后端逐个索引检索
+    - 合并前按绝对相关度过滤：ES 后端为各索引原始得分的 min_score，本地后端为向量相似度
+      LOCAL_FEDERATED_MIN_SIMILARITY（RRF 分只反映名次）；本地后端的得分另乘以向量相似度
+    - 得分统一除以所有索引中的最高分后合并排序，取前 top_k 条
+    - 结果字段统一为刑法索引的结构，并附带 index 与 law（法律名称）
+    单个索引失败时只返回其余索引的结果
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "local":
+        per_index = []
+        for index_name in index_names:
+            results = []
+            for doc in search_content(index_name, content_question, top_k=top_k, backend=backend):
+                if (doc.get("similarity") or 0.0) >= LOCAL_FEDERATED_MIN_SIMILARITY:
+                    doc["score"] *= doc["similarity"]
+                    results.append(doc)
+            per_index.append(results)
+        return _merge_federated(index_names, per_index, top_k)
+
+    cache_key = (normalize_text(content_question), tuple(index_names), top_k, min_score)
+    if use_cache:
+        version = "|".join(get_index_version(index_name) for index_name in index_names)
+        cached = RESULT_CACHE.get(cache_key, version)
+        if cached is not None:
+            logger.info(f"检索结果缓存命中: {content_question}")
+            return list(cached)
+
+    query_vector = generate_query_vector(content_question)
+    if not query_vector:
+        return []
+
+    searches = []
+    hierarchy = load_hierarchy()
+    for index_name in index_names:
+        searches.append({"index": index_name})
+        searches.append(build_index_query(index_name, content_question, query_vector, top_k=top_k,
+                                          min_score=min_score, hierarchy=hierarchy))
+    try:
+        with stage("search"):
+            response = get_es_client().msearch(searches=searches, request_timeout=45)
+    except Exception as e:
+        logger.error(f"联合检索失败: {str(e)}")
+        return []
+
+    with stage("post_process"):
+        per_index = []
+        for index_name, item in zip(index_names, response["responses"]):
+            if "error" in item:
+                logger.error(f"搜索失败: {index_name}: {item['error']}")
+                per_index.append([])
+                continue
+            per_index.append(process_search_results(item, min_score))
+        results = _merge_federated(index_names, per_index, top_k)
+    if use_cache:
+        RESULT_CACHE.put(cache_key, results, version)
+    return list(results)
+
+
+def _merge_federated(
+        index_names: Sequence[str],
+        per_index: List[List[Dict[str, Any]]],
+        top_k: int
+) -> List[Dict[str, Any]]:
+    scale_to_max(per_index)
+    merged = []
+    for index_name, results in zip(index_names, per_index):
+        for doc in results:
+            # 本地索引的记录保留原始字段，这里统一为刑法索引的结构
+            doc.update(normalize_fields(doc), index=index_name, law=LAW_NAMES.get(index_name, index_name))
+            merged.append(doc)
+    merged.sort(key=lambda doc: doc["score"], reverse=True)
+    return merged[:top_k]
+
+
+def load_local_index(index_name: str) -> Tuple["NumpyVectorIndex", LexicalIndex]:
+    """
+    加载并缓存本地向量索引（内存映射），同时基于条文文本构建 n-gram 倒排索引
+    本地索引目录不存在时从语料快照构建（无需重新解析 docx 或编码）
+    """
+    if index_name not in LOCAL_INDEXES:
+        from corpus_snapshot import CorpusSnapshot, snapshot_exists
+        from vector_store import NumpyVectorIndex
+
+        logger.info(f"Loading local vector index: {index_name}")
+        local_path = os.path.join(LOCAL_INDEX_DIR, index_name)
+        snapshot_dir = os.path.join(CORPUS_SNAPSHOT_DIR, index_name)
+        if os.path.isdir(local_path) or not snapshot_exists(snapshot_dir):
+            vector_index = NumpyVectorIndex.load(local_path)
+        else:
+            snapshot = CorpusSnapshot.load(snapshot_dir)
+            vector_index = snapshot.to_vector_index(VECTOR_FIELDS.get(index_name, "article_content_vector"))
+        lexical_index = LexicalIndex.from_records(
+            vector_index.ids,
+            vector_index.records,
+            LEXICAL_FIELD_WEIGHTS.get(index_name, FIELD_WEIGHTS)
+        )
+        LOCAL_INDEXES[index_name] = (vector_index, lexical_index)
+    return LOCAL_INDEXES[index_name]
+
+
+def query_local_content(
+        index_name: str,
+        content_question: str,
+        top_k: int = 50,
+        min_similarity: float = LOCAL_MIN_SIMILARITY,
+        hybrid: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    在进程内索引上执行检索，返回结构与 query_es_content 一致
+    - hybrid=True：BM25 文本检索与向量检索各取候选，按倒数排名融合，score 为 RRF 分
+    - hybrid=False：只做向量检索，score 为余弦相似度
+    结果另带 similarity（问题与条文的余弦相似度），供联合检索按绝对相关度过滤
+    """
+    query_vector = generate_query_vector(content_question)
+    if not query_vector:
+        return []
+
+    try:
+        vector_index, lexical_index = load_local_index(index_name)
+    except Exception as e:
+        logger.error(f"本地索引加载失败: {str(e)}")
+        return []
+
+    with stage("search"):
+        vector_results = vector_index.search(query_vector, top_k=top_k, min_score=min_similarity)
+        if not hybrid:
+            return [{**doc, "similarity": doc["score"]} for doc in vector_results]
+        lexical_results = lexical_index.search(content_question, top_k=top_k)
+
+    with stage("post_process"):
+        fused = reciprocal_rank_fusion([lexical_results, vector_results], top_k=top_k)
+        for doc, similarity in zip(fused, vector_index.similarities(query_vector, [doc["id"] for doc in fused])):
+            doc["similarity"] = similarity
+        return fused
+
+
+def load_article_lookup(index_name: str) -> ArticleLookup:
+    """
+    条文编号索引：本地后端取自本地索引的 records，ES 后端一次性读取索引中的全部条文
+    索引版本变化（重建或增量更新）后重新加载
+    """
+    version = "local" if RETRIEVAL_BACKEND == "local" else get_index_version(index_name)
+    cached = ARTICLE_LOOKUPS.get(index_name)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    if RETRIEVAL_BACKEND == "local":
+        vector_index, _ = load_local_index(index_name)
+        lookup = ArticleLookup.from_records(vector_index.ids, vector_index.records)
+    else:
+        from elasticsearch import helpers
+
+        lookup = ArticleLookup()
+        for hit in helpers.scan(
+                get_es_client(),
+                index=index_name,
+                query={"query": {"match_all": {}}, "_source": SOURCE_FIELDS + ["article_number", "content"]}
+        ):
+            lookup.add(hit["_id"], hit.get("_source", {}))
+    logger.info(f"条文编号索引已加载: {index_name}（{len(lookup)} 条）")
+    ARTICLE_LOOKUPS[index_name] = (version, lookup)
+    return lookup
+
+
+def lookup_cited_articles(index_name: str, content_question: str) -> List[Dict[str, Any]]:
+    """
+    问题中直接引用的条文（如“第二百三十二条”、“第133条之一”），结构与检索结果一致并标记 pinned
+    按编号直接取条文，本身不做向量编码与检索；只引用条文的问题由调用方直接使用这些条文（见 is_citation_only）
+    未引用条文或索引不可用时返回空列表
+    """
+    try:
+        lookup = load_article_lookup(index_name)
+    except Exception as e:
+        logger.warning(f"条文编号索引加载失败: {str(e)}")
+        return []
+
+    with stage("article_lookup"):
+        articles = lookup.find(content_question)
+    return [{"id": article["id"], "score": None, "pinned": True, **normalize_fields(article)} for article in articles]
+
+
+def lookup_cited_articles_federated(index_names: Sequence[str], content_question: str) -> List[Dict[str, Any]]:
+    """
+    联合检索时的条文编号直查：问题提到某部法律（如“宪法第一条”）时只查该法律，否则查全部索引
+    """
+    mentioned = [name for name in index_names if LAW_NAMES.get(name, name) in content_question]
+    articles = []
+    for index_name in mentioned or index_names:
+        for article in lookup_cited_articles(index_name, content_question):
+            article.update(index=index_name, law=LAW_NAMES.get(index_name, index_name))
+            articles.append(article)
+    return articles[:MAX_PINNED]
+
+
+def search_content(
+        index_name: str,
+        content_question: str,
+        top_k: int = 50,
+        min_score: float = 0.5,
+        backend: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    按配置的检索后端执行查询
+    min_score 只作用于 ES 后端；本地后端使用 LOCAL_MIN_SIMILARITY（余弦相似度）
+    """
+    backend = backend or RETRIEVAL_BACKEND
+    if backend == "local":
+        return query_local_content(index_name, content_question, top_k=top_k)
+    if backend == "es_async":
+        # 文本检索与问题向量编码并发执行
+        from async_pipeline import query_es_content_concurrent
+        return query_es_content_concurrent(index_name, content_question, top_k=top_k, min_score=min_score)
+    return query_es_content(index_name, content_question, top_k=top_k, min_score=min_score)
+
+
+def normalize_fields(source: Dict[str, Any]) -> Dict[str, Any]:
+    """统一各索引的字段：宪法索引的条文编号作为 article_title、content 作为 article_content"""
+    return {
+        "chapter_title": source.get("chapter_title", ""),
+        "sections_title": source.get("sections_title", ""),
+        "subsections_title": source.get("subsections_title", ""),
+        "article_title": source.get("article_title") or source.get("article_number", ""),
+        "article_content": source.get("article_content") or source.get("content", "")
+    }
 
 
 def process_search_results(
         response: Dict,
-        min_score: float
+        min_score: float,
+        diagnostic: bool = False
 ) -> List[Dict[str, Any]]:
-    """处理和分析搜索结果"""
+    """
+    处理搜索结果
+    diagnostic=True 时记录评分统计，并在结果中保留 explain 信息
+    """
     hits = response.get("hits", {}).get("hits", [])
 
-    scores = [hit["_score"] for hit in hits]
-    logger.info(f"""
+    if diagnostic and hits:
+        import numpy as np
+
+        scores = [hit["_score"] for hit in hits]
+        logger.info(f"""
     评分分析：
     - 平均分: {np.mean(scores):.2f}
     - 最高分: {np.max(scores):.2f}
@@ -177,40 +696,173 @@ def process_search_results(
         if hit["_score"] < min_score:
             continue
 
-        source = hit.get("_source", {})
-        results.append({
-            "id": hit["_id"],
-            "score": hit["_score"],
-            "chapter_title": source.get("chapter_title", ""),
-            "sections_title": source.get("sections_title", ""),
-            "subsections_title": source.get("subsections_title", ""),
-            "article_title": source.get("article_title", ""),
-            "article_content": source.get("article_content", "")[:3000],
-            "explanation": hit.get("_explanation")
-        })
+        result = {"id": hit["_id"], "score": hit["_score"], **normalize_fields(hit.get("_source", {}))}
+        if diagnostic:
+            result["explanation"] = hit.get("_explanation")
+        results.append(result)
 
     return results
 
 
-def query_ollama(model, prompt, context) -> List[Dict[str, Any]]:
-    """简化版 Ollama 查询函数"""
-    url = "http://localhost:11434/api/chat"
-    headers = {"Content-Type": "application/json"}
+def profile_es_query(
+        index_name: str,
+        content_question: str,
+        top_k: int = 50,
+        min_score: float = 0.5,
+        histogram_bins: int = 10
+) -> Dict[str, Any]:
+    """
+    诊断模式：对单个问题执行带 explain/profile 的查询（不走结果缓存），返回
+    - results: 带 explanation 的检索结果
+    - took: ES 耗时（毫秒）
+    - profile: ES profile 信息
+    - score_stats / score_histogram: 评分统计与直方图
+    """
+    query_vector = generate_query_vector(content_question)
+    if not query_vector:
+        return {}
 
-    data = {
-        "model": model,
-        "messages": [
-            {
-                "role": "system",
-                "content": f"你是一个法律专家，请基于以下和问题相关的内容回答：\n{context}"
-            },
-            {"role": "user", "content": prompt}
-        ],
-        "stream": False
+    search_query = build_es_query(
+        query=content_question,
+        query_vector=query_vector,
+        top_k=top_k,
+        min_score=0,  # 统计全部候选的评分分布，min_score 在结果处理时再过滤
+        diagnostic=True,
+        hierarchy=load_hierarchy()
+    )
+    response = get_es_client().search(index=index_name, body=search_query, request_timeout=45)
+
+    import numpy as np
+
+    scores = np.array([hit["_score"] for hit in response.get("hits", {}).get("hits", [])])
+    report = {
+        "results": process_search_results(response, min_score, diagnostic=True),
+        "took": response.get("took"),
+        "profile": response.get("profile"),
+        "score_stats": {},
+        "score_histogram": {}
     }
+    if scores.size:
+        counts, edges = np.histogram(scores, bins=histogram_bins)
+        report["score_stats"] = {
+            "mean": float(scores.mean()),
+            "max": float(scores.max()),
+            "min": float(scores.min()),
+            "above_min_score": int((scores >= min_score).sum()),
+            "total": int(scores.size)
+        }
+        report["score_histogram"] = {"counts": counts.tolist(), "bin_edges": edges.tolist()}
+    return report
+
+
+def build_chat_messages(prompt: str, context: str) -> List[Dict[str, str]]:
+    """构建发送给 Ollama 的对话消息"""
+    return [
+        {
+            "role": "system",
+            "content": f"你是一个法律专家，请基于以下和问题相关的内容回答：\n{context}"
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+
+def query_ollama(model, prompt, context) -> List[Dict[str, Any]]:
+    """简化版 Ollama 查询函数（复用进程内共享的连接池客户端）"""
+    try:
+        with stage("llm_total"):
+            result = get_ollama_client().chat(build_chat_messages(prompt, context), model=model)
+        record_ollama_tokens(result)
+        return result
+    except Exception as e:
+        logger.error(f"Ollama 请求失败: {str(e)}")
+        return {"error": str(e)}
+
+
+def record_ollama_tokens(final_chunk: Dict[str, Any]) -> None:
+    """记录 Ollama 返回的 prompt / completion token 数"""
+    if "prompt_eval_count" in final_chunk:
+        record_tokens("prompt", final_chunk["prompt_eval_count"])
+    if "eval_count" in final_chunk:
+        record_tokens("completion", final_chunk["eval_count"])
+
+
+def query_ollama_stream(model, prompt, context) -> Iterator[str]:
+    """
+    流式 Ollama 查询：逐行解析 /api/chat 返回的 NDJSON，按到达顺序产出回答片段
+    同时记录首 token 耗时（llm_first_token）与总耗时（llm_total）
+    """
+    start = time.perf_counter()
+    first = True
+    try:
+        for chunk in get_ollama_client().chat_stream(
+                build_chat_messages(prompt, context), model=model, on_done=record_ollama_tokens
+        ):
+            if first:
+                record_stage("llm_first_token", time.perf_counter() - start)
+                first = False
+            yield chunk
+    finally:
+        record_stage("llm_total", time.perf_counter() - start)
+
+
+def split_think_section(text: str) -> Tuple[str, str]:
+    """
+    将 deepseek-r1 的输出拆分为 (<think> 思考过程, 正式回答)
+    流式输出时 </think> 可能尚未到达，此时全部视为思考过程
+    """
+    start = text.find("<think>")
+    if start == -1:
+        return "", text
+    end = text.find("</think>", start)
+    if end == -1:
+        return text[start + len("<think>"):].strip(), text[:start]
+    thinking = text[start + len("<think>"):end].strip()
+    answer = text[:start] + text[end + len("</think>"):]
+    return thinking, answer.strip()
+
+
+def warm_up(index_names: Tuple[str, ...] = ("crime_documents",), ollama: bool = True) -> Dict[str, float]:
+    """
+    预热：加载嵌入模型并执行一次编码、加载上下文分词器、建立 ES 连接（本地后端则加载本地索引）、
+    加载条文编号索引、预加载 Ollama 模型
+    返回各步骤耗时（秒），便于确认部署或重启后首个问题不再额外变慢
+    """
+    timings = {"import": IMPORT_TIME}
+
+    start = time.perf_counter()
+    load_model().encode("预热", normalize_embeddings=True)
+    timings["embedding_model"] = time.perf_counter() - start
+
+    # 上下文 token 计数用的分词器（首次加载需导入 transformers，可能还要从 HF hub 下载）
+    start = time.perf_counter()
+    load_tokenizer()
+    timings["tokenizer"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    try:
+        if RETRIEVAL_BACKEND == "local":
+            for index_name in index_names:
+                load_local_index(index_name)
+        else:
+            get_es_client().info()
+            load_hierarchy()
+        for index_name in index_names:
+            load_article_lookup(index_name)
+    except Exception as e:
+        logger.warning(f"检索后端预热失败: {str(e)}")
+    timings["retrieval_backend"] = time.perf_counter() - start
+
+    if ollama:
+        start = time.perf_counter()
+        try:
+            get_ollama_client().warm_up()
+        except Exception as e:
+            logger.warning(f"Ollama 预热失败: {str(e)}")
+        timings["ollama"] = time.perf_counter() - start
 
-    response = requests.post(url, headers=headers, json=data)
-    return response.json()
-    # 2. 构建上下文
+    logger.info("预热完成: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
 
 
+IMPORT_TIME = time.perf_counter() - _IMPORT_START
+logger.info(f"legal_query_utils 导入耗时: {IMPORT_TIME * 1000:.1f}ms")
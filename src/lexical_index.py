@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# 中文按字切分的连续片段 / 英文数字整词
+TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[A-Za-z0-9]+")
+
+
+def char_ngrams(text: str, ngram_sizes: Sequence[int] = (2, 3)) -> List[str]:
+    """
+    中文按字符 n-gram 切分（默认 bigram + trigram），英文数字保留整词
+    单字片段（如“罪”）直接作为一个词项
+    """
+    terms = []
+    for segment in TOKEN_PATTERN.findall(text or ""):
+        if not "\u4e00" <= segment[0] <= "\u9fff":
+            terms.append(segment.lower())
+            continue
+        if len(segment) == 1:
+            terms.append(segment)
+            continue
+        for n in ngram_sizes:
+            terms.extend(segment[i:i + n] for i in range(len(segment) - n + 1))
+    return terms
+
+
+class LexicalIndex:
+    """
+    本地倒排索引：每个字段单独建 n-gram 倒排表并计算 BM25，
+    字段间按权重以 best_fields + tie_breaker 的方式合并（与 build_es_query 的 multi_match 一致）
+    """
+
+    def __init__(
+            self,
+            field_weights: Dict[str, float],
+            k1: float = 1.2,
+            b: float = 0.75,
+            tie_breaker: float = 0.3,
+            ngram_sizes: Sequence[int] = (2, 3)
+    ):
+        self.field_weights = field_weights
+        self.k1 = k1
+        self.b = b
+        self.tie_breaker = tie_breaker
+        self.ngram_sizes = ngram_sizes
+
+        self.ids: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+        # 字段 -> 词项 -> [(文档序号, 词频)]
+        self.postings: Dict[str, Dict[str, List[Tuple[int, int]]]] = {f: defaultdict(list) for f in field_weights}
+        self.doc_lengths: Dict[str, List[int]] = {f: [] for f in field_weights}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(
+            cls,
+            ids: Iterable[str],
+            records: Iterable[Dict[str, Any]],
+            field_weights: Dict[str, float],
+            **kwargs
+    ) -> "LexicalIndex":
+        index = cls(field_weights, **kwargs)
+        for doc_id, record in zip(ids, records):
+            index.add(doc_id, record)
+        return index
+
+    def add(self, doc_id: str, record: Dict[str, Any]) -> None:
+        doc_idx = len(self.ids)
+        self.ids.append(doc_id)
+        self.records.append(record)
+        for field in self.field_weights:
+            terms = char_ngrams(record.get(field) or "", self.ngram_sizes)
+            self.doc_lengths[field].append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[field][term].append((doc_idx, tf))
+
+    def _field_scores(self, field: str, query_terms: Iterable[str]) -> Dict[int, float]:
+        lengths = self.doc_lengths[field]
+        total = len(lengths)
+        avgdl = (sum(lengths) / total) if total else 0.0
+        if not avgdl:
+            return {}
+
+        scores: Dict[int, float] = defaultdict(float)
+        postings = self.postings[field]
+        for term in query_terms:
+            docs = postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_idx, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * lengths[doc_idx] / avgdl)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """BM25 检索，返回与 ES 结果结构一致的字典列表"""
+        query_terms = set(char_ngrams(query, self.ngram_sizes))
+        if not query_terms or not self.ids:
+            return []
+
+        # 每个文档：各字段加权得分列表
+        per_doc: Dict[int, List[float]] = defaultdict(list)
+        for field, weight in self.field_weights.items():
+            for doc_idx, score in self._field_scores(field, query_terms).items():
+                per_doc[doc_idx].append(score * weight)
+
+        combined = []
+        for doc_idx, field_scores in per_doc.items():
+            best = max(field_scores)
+            combined.append((best + self.tie_breaker * (sum(field_scores) - best), doc_idx))
+        combined.sort(reverse=True)
+
+        return [
+            {"id": self.ids[doc_idx], "score": score, **self.records[doc_idx]}
+            for score, doc_idx in combined[:top_k]
+        ]
+
+
+def reciprocal_rank_fusion(
+        result_lists: Sequence[List[Dict[str, Any]]],
+        top_k: int = 10,
+        k: int = 60
+) -> List[Dict[str, Any]]:
+    """
+    倒数排名融合（RRF）：score = Σ 1 / (k + rank)
+    只依赖各路结果的名次，不需要对 BM25 分和余弦相似度做归一化
+    """
+    fused: Dict[str, float] = defaultdict(float)
+    hits: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, 1):
+            fused[hit["id"]] += 1.0 / (k + rank)
+            hits.setdefault(hit["id"], hit)
+
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [{**hits[doc_id], "score": score} for doc_id, score in ranked]
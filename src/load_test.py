@@ -0,0 +1,408 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import answer_cache
+import embedding_cache
+import legal_query_utils
+import ollama_client
+from benchmark import QUESTIONS, STAND_IN_ANSWER, StandInEncoder, percentile
+from legal_query_utils import SOURCE_FIELDS
+from qa_pipeline import answer_question
+from result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# 替代服务记录的排队时间（等待可用的检索线程 / 生成槽位）
+QUEUE_WAITS: Dict[str, List[float]] = {"es_queue": [], "llm_queue": []}
+_queue_lock = threading.Lock()
+
+
+class Latency:
+    """可注入的延迟：均值 + 正态抖动（秒），不小于 0"""
+
+    def __init__(self, mean: float, jitter: float = 0.0):
+        self.mean = mean
+        self.jitter = jitter
+
+    def sample(self) -> float:
+        return max(0.0, random.gauss(self.mean, self.jitter)) if self.jitter else self.mean
+
+    def sleep(self) -> None:
+        time.sleep(self.sample())
+
+
+def acquire_slot(semaphore: threading.Semaphore, queue_name: str) -> None:
+    start = time.perf_counter()
+    semaphore.acquire()
+    with _queue_lock:
+        QUEUE_WAITS[queue_name].append(time.perf_counter() - start)
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    extra_headers: Dict[str, str] = {}
+
+    def read_raw(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def read_body(self) -> Dict[str, Any]:
+        body = self.read_raw()
+        return json.loads(body) if body else {}
+
+    def send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in self.extra_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeElasticsearch(_JsonHandler):
+    """
+    替代 Elasticsearch：返回集群信息、document_metadata 与固定条文集合上的检索结果
+    search_slots 模拟节点的检索线程池大小，超出时请求排队
+    """
+    extra_headers = {"X-Elastic-Product": "Elasticsearch"}
+    documents: List[Dict[str, Any]] = []
+    latency = Latency(0.02)
+    search_slots = threading.Semaphore(8)
+
+    def do_GET(self):
+        self.read_body()
+        path = self.path.split("?")[0].strip("/")
+        if not path:
+            self.send_json({
+                "name": "fake-es",
+                "cluster_name": "load-test",
+                "version": {"number": "8.13.0", "build_flavor": "default"},
+                "tagline": "You Know, for Search"
+            })
+        elif path.endswith("_doc/document_metadata"):
+            index = path.split("/")[0]
+            self.send_json({"_index": f"{index}_v1", "_id": "document_metadata", "found": True,
+                            "_source": {"index_version": "load-test"}})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        for name, value in self.extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if re.search(r"/_msearch$", path):
+            # NDJSON：header 行与 body 行交替
+            lines = [json.loads(line) for line in self.read_raw().splitlines() if line.strip()]
+            self.send_json({"took": 1, "responses": [self.search(body) for body in lines[1::2]]})
+        elif re.search(r"/_search$", path):
+            self.send_json(self.search(self.read_body()))
+        else:
+            self.read_raw()
+            self.send_json({"error": "not found"}, status=404)
+
+    def search(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        acquire_slot(self.search_slots, "es_queue")
+        try:
+            self.latency.sleep()
+        finally:
+            self.search_slots.release()
+
+        size = int(body.get("size", 10))
+        rng = random.Random(json.dumps(body.get("query", {}), sort_keys=True)[:200])
+        sample = rng.sample(self.documents, min(size, len(self.documents)))
+        hits = [{"_index": "crime_documents_v1", "_id": doc["id"], "_score": rng.uniform(10.0, 40.0),
+                 "_source": {field: doc.get(field) for field in SOURCE_FIELDS}} for doc in sample]
+        hits.sort(key=lambda hit: hit["_score"], reverse=True)
+        return {"took": 1, "timed_out": False, "hits": {"total": {"value": len(hits)}, "hits": hits}}
+
+
+class FakeOllama(_JsonHandler):
+    """
+    替代 Ollama：/api/chat 按首 token 延迟与逐 token 间隔返回 NDJSON
+    parallel_slots 模拟 OLLAMA_NUM_PARALLEL，超出时请求排队
+    """
+    first_token = Latency(0.3)
+    token_interval = 0.02
+    answer_tokens: List[str] = []
+    parallel_slots = threading.Semaphore(1)
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.startswith("/api/generate"):
+            self.send_json({"model": body.get("model"), "done": True})
+            return
+        if not self.path.startswith("/api/chat"):
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", []))
+        final = {"model": body.get("model"), "done": True,
+                 "prompt_eval_count": prompt_tokens, "eval_count": len(self.answer_tokens)}
+
+        acquire_slot(self.parallel_slots, "llm_queue")
+        try:
+            if not body.get("stream", True):
+                time.sleep(self.first_token.sample() + self.token_interval * len(self.answer_tokens))
+                self.send_json({**final, "message": {"role": "assistant", "content": "".join(self.answer_tokens)}})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.first_token.sleep()
+            for token in self.answer_tokens:
+                self.write_chunk({"model": body.get("model"), "done": False,
+                                  "message": {"role": "assistant", "content": token}})
+                time.sleep(self.token_interval)
+            self.write_chunk({**final, "message": {"role": "assistant", "content": ""}})
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            self.parallel_slots.release()
+
+    def write_chunk(self, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭长连接属于正常情况，不输出堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(handler) -> ThreadingHTTPServer:
+    server = _QuietServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+
+def load_documents(records_path: Optional[str], count: int = 500) -> List[Dict[str, Any]]:
+    """检索替代服务使用的条文：优先读取本地索引导出的 records.json，否则生成长度相近的合成条文"""
+    if records_path and os.path.exists(records_path):
+        with open(records_path, encoding="utf-8") as f:
+            data = json.load(f)
+        return [{"id": doc_id, **record} for doc_id, record in zip(data["ids"], data["records"])]
+
+    return [{
+        "id": f"第{i}条",
+        "chapter_title": f"第{i % 3 + 1}编",
+        "sections_title": f"第{i % 10 + 1}章",
+        "subsections_title": None,
+        "article_title": f"第{i}条",
+        "article_content": "合成条文内容，用于压测上下文构建。" * 8
+    } for i in range(count)]
+
+
+def configure_stand_ins(args) -> None:
+    """把问答流程的外部依赖指向替代服务；嵌入模型替换为带固定耗时的替代编码器"""
+    for waits in QUEUE_WAITS.values():
+        waits.clear()
+    FakeElasticsearch.documents = load_documents(args.records)
+    FakeElasticsearch.latency = Latency(args.es_latency, args.es_jitter)
+    FakeElasticsearch.search_slots = threading.Semaphore(args.es_threads)
+    FakeOllama.first_token = Latency(args.llm_first_token, args.llm_jitter)
+    FakeOllama.token_interval = args.llm_token_interval
+    FakeOllama.answer_tokens = list(STAND_IN_ANSWER[:args.llm_tokens])
+    FakeOllama.parallel_slots = threading.Semaphore(args.llm_parallel)
+
+    es_server = start_server(FakeElasticsearch)
+    ollama_server = start_server(FakeOllama)
+
+    legal_query_utils.ES_HOSTS = [f"http://127.0.0.1:{es_server.server_port}"]
+    legal_query_utils.ES_CLIENT = None
+    legal_query_utils.MODEL_CACHE = StandInEncoder(call_overhead=args.embed_latency)
+    ollama_client.OLLAMA_CLIENT = ollama_client.OllamaClient(
+        base_url=f"http://127.0.0.1:{ollama_server.server_port}",
+        pool_size=args.concurrency
+    )
+
+    # 向量缓存写入临时文件，避免污染真实缓存
+    tmpdir = tempfile.mkdtemp(prefix="legal_load_")
+    # 问题集较小，缓存开启时重复问题几乎都命中缓存，测到的不是检索与生成；默认全部关闭，--cache 时单独压测缓存开启的情况
+    embedding_path = os.path.join(tmpdir, "embeddings.sqlite3")
+    if args.cache:
+        embedding_cache.EMBEDDING_CACHE = embedding_cache.EmbeddingCache(embedding_path)
+    else:
+        embedding_cache.EMBEDDING_CACHE = embedding_cache.EmbeddingCache(embedding_path, max_entries=0)
+        legal_query_utils.RESULT_CACHE = ResultCache(max_entries=0)
+        answer_cache.ANSWER_CACHE = answer_cache.SemanticAnswerCache(max_entries=0)
+
+
+def run_load(
+        questions: List[str],
+        total: int,
+        concurrency: int,
+        rate: float,
+        stream: bool = True,
+        seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    回放问题集
+    - rate > 0：开环，按泊松过程（指数间隔）到达，超出 concurrency 的请求在线程池中排队
+    - rate = 0：闭环，concurrency 个用户各自连续提问
+    返回每个请求的到达/开始/结束时间与各阶段耗时
+    """
+    rng = random.Random(seed)
+    records: List[Dict[str, Any]] = []
+    records_lock = threading.Lock()
+
+    def handle(question: str, arrived: float) -> None:
+        started = time.perf_counter()
+        error = None
+        stages: Dict[str, float] = {}
+        try:
+            result = answer_question(question, stream=stream)
+            stages = dict(result["trace"].stages)
+        except Exception as e:
+            error = str(e)
+        finished = time.perf_counter()
+        with records_lock:
+            records.append({"question": question, "arrived": arrived, "started": started,
+                            "finished": finished, "stages": stages, "error": error})
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="user") as executor:
+        if rate > 0:
+            next_arrival = time.perf_counter()
+            for i in range(total):
+                next_arrival += rng.expovariate(rate)
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(handle, questions[i % len(questions)], time.perf_counter())
+        else:
+            counter = iter(range(total))
+            counter_lock = threading.Lock()
+
+            def user() -> None:
+                while True:
+                    with counter_lock:
+                        i = next(counter, None)
+                    if i is None:
+                        return
+                    handle(questions[i % len(questions)], time.perf_counter())
+
+            for _ in range(concurrency):
+                executor.submit(user)
+
+    return records
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0
+    }
+
+
+def build_report(records: List[Dict[str, Any]], cache: bool = False) -> Dict[str, Any]:
+    """汇总吞吐、端到端延迟（含排队）、线程池排队、各阶段耗时与替代服务内的排队时间"""
+    ok = [r for r in records if not r["error"]]
+    wall = max(r["finished"] for r in records) - min(r["arrived"] for r in records) if records else 0.0
+
+    stage_names = sorted({name for r in ok for name in r["stages"]})
+    report = {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "latency": summarize([r["finished"] - r["arrived"] for r in ok]),
+        "queue.app": summarize([r["started"] - r["arrived"] for r in ok]),
+        "stages": {name: summarize([r["stages"][name] for r in ok if name in r["stages"]]) for name in stage_names}
+    }
+    for name, waits in QUEUE_WAITS.items():
+        report["stages"][f"queue.{name}"] = summarize(list(waits))
+    report["cache"] = "on" if cache else "off"
+    report["result_cache"] = legal_query_utils.RESULT_CACHE.stats()
+    report["answer_cache"] = answer_cache.get_answer_cache().stats()
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"requests {report['requests']}  errors {report['errors']}  wall {report['wall_seconds']}s  "
+          f"throughput {report['throughput_rps']} req/s")
+    print(f"{'':<22}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    rows = [("end_to_end", report["latency"]), ("queue.app", report["queue.app"])] + list(report["stages"].items())
+    for name, s in rows:
+        print(f"{name:<22}{s['count']:>7}{s['p50_ms']:>11.2f}{s['p95_ms']:>11.2f}{s['p99_ms']:>11.2f}{s['max_ms']:>11.2f}")
+    print(f"cache {report['cache']}  result_cache hit_rate {report['result_cache']['hit_rate']:.2f}  "
+          f"answer_cache hits {report['answer_cache']['hits']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="问答流程压测：替代 ES / Ollama 服务，可注入延迟")
+    parser.add_argument("--requests", type=int, default=200, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发用户数（线程池大小）")
+    parser.add_argument("--rate", type=float, default=0.0, help="到达速率（请求/秒，泊松到达）；0 为闭环")
+    parser.add_argument("--questions-file", help="问题集文件（每行一个问题）")
+    parser.add_argument("--records", default=os.path.join("local_index", "crime_documents", "records.json"),
+                        help="替代 ES 返回的条文（本地索引的 records.json），不存在时使用合成条文")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式生成")
+    parser.add_argument("--cache", action="store_true",
+                        help="开启向量、检索结果与语义答案缓存（默认关闭，使每个请求都真实编码、检索与生成）")
+    parser.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="每次向量编码的耗时（秒）")
+    parser.add_argument("--es-latency", type=float, default=0.02, help="ES 检索耗时（秒）")
+    parser.add_argument("--es-jitter", type=float, default=0.005)
+    parser.add_argument("--es-threads", type=int, default=8, help="ES 检索线程数")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Ollama 首 token 延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-token-interval", type=float, default=0.01, help="Ollama 逐 token 间隔（秒）")
+    parser.add_argument("--llm-tokens", type=int, default=100, help="每个回答的 token 数")
+    parser.add_argument("--llm-parallel", type=int, default=1, help="Ollama 同时生成的请求数（OLLAMA_NUM_PARALLEL）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    questions = list(QUESTIONS)
+    if args.questions_file:
+        with open(args.questions_file, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    random.Random(args.seed).shuffle(questions)
+
+    configure_stand_ins(args)
+    records = run_load(questions, args.requests, args.concurrency, args.rate,
+                       stream=not args.no_stream, seed=args.seed)
+    report = build_report(records, cache=args.cache)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
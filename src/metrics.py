@@ -0,0 +1,197 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 指标 HTTP 端口（Prometheus 抓取 /metrics），为 0 时不启动；默认只监听本机，需要远程抓取时设 METRICS_HOST=0.0.0.0
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+
+# 各阶段耗时直方图的桶（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# token 数直方图的桶
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class Histogram:
+    """累积直方图（与 Prometheus histogram 语义一致）"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶上界估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """进程内指标注册表：按 (指标名, 标签) 保存直方图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self._help: Dict[str, str] = {}
+
+    def observe(self, name: str, label: str, value: str, amount: float,
+                buckets: Sequence[float] = LATENCY_BUCKETS, help_text: str = "") -> None:
+        with self._lock:
+            key = (name, label, value)
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            self._histograms[key].observe(amount)
+
+    def snapshot(self) -> Dict[Tuple[str, str, str], Histogram]:
+        with self._lock:
+            return dict(self._histograms)
+
+    def render_prometheus(self) -> str:
+        """输出 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _, _ in self._histograms})
+            for name in names:
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, label, value), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, cumulative in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Trace:
+    """单个问题的各阶段耗时与数值记录"""
+
+    def __init__(self, question: str):
+        self.question = question
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.values: Dict[str, Any] = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        # 同一阶段多次执行（如多次检索）时累加
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "question": self.question,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+            **self.values
+        }
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("qa_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(question: str) -> Iterator[Trace]:
+    """
+    开始记录一个问题的处理过程；结束时汇总总耗时并输出一行结构化日志
+    """
+    trace = Trace(question)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        REGISTRY.observe("qa_request_seconds", "stage", "total", time.perf_counter() - trace.started,
+                         help_text="End-to-end question answering latency")
+        logger.info("qa_trace " + json.dumps(trace.to_dict(), ensure_ascii=False))
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """记录一个阶段耗时：写入直方图，并计入当前问题的 trace（如有）"""
+    REGISTRY.observe("qa_stage_seconds", "stage", name, seconds, help_text="Per-stage latency of the QA pipeline")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """计时上下文：with stage("embed"): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_tokens(kind: str, count: int) -> None:
+    """记录 token 数（prompt / completion / context）"""
+    REGISTRY.observe("qa_tokens", "kind", kind, count, buckets=TOKEN_BUCKETS, help_text="Token counts per question")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.values[f"{kind}_tokens"] = count
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+METRICS_SERVER: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """
+    在后台线程中启动 /metrics 端点（每个进程只启动一次）
+    端口被占用（如同时运行了另一个实例）时只记录警告并返回 None，不影响问答
+    """
+    global METRICS_SERVER
+    if METRICS_SERVER is None and port:
+        try:
+            METRICS_SERVER = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"指标端点启动失败（{host}:{port}），不提供 /metrics: {str(e)}")
+            return None
+        threading.Thread(target=METRICS_SERVER.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"指标端点已启动: http://{host}:{port}/metrics")
+    return METRICS_SERVER
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ollama 服务地址、默认模型与模型驻留时间，可通过环境变量覆盖
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "deepseek-r1:7b")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaClient:
+    """
+    可复用的 Ollama 客户端
+    - requests.Session + 连接池，长连接复用
+    - 连接/读取超时分开设置
+    - 只对连接失败和 502/503/504 做有限次重试（生成请求本身不重放）
+    - keep_alive 让模型在两次提问之间常驻内存
+    """
+
+    def __init__(
+            self,
+            base_url: str = OLLAMA_BASE_URL,
+            model: str = OLLAMA_MODEL,
+            keep_alive: str = OLLAMA_KEEP_ALIVE,
+            connect_timeout: float = 5.0,
+            read_timeout: float = 300.0,
+            max_retries: int = 2,
+            pool_size: int = 10
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+
+        # requests 导入较慢，延迟到创建客户端时
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            backoff_factor=0.5,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _payload(self, messages: List[Dict[str, str]], model: Optional[str], stream: bool) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive
+        }
+
+    def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> Dict[str, Any]:
+        """非流式对话，返回 /api/chat 的完整 JSON"""
+        response = self.session.post(
+            f"{self.base_url}/api/chat",
+            json=self._payload(messages, model, stream=False),
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def chat_stream(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            on_done: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Iterator[str]:
+        """
+        流式对话：逐行解析 NDJSON，按到达顺序产出回答片段
+        on_done 在收到最后一个分片（含 token 统计）时被调用
+        """
+        with self.session.post(
+                f"{self.base_url}/api/chat",
+                json=self._payload(messages, model, stream=True),
+                timeout=self.timeout,
+                stream=True
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                content = chunk.get("message", {}).get("content", "")
+                if content:
+                    yield content
+                if chunk.get("done"):
+                    if on_done is not None:
+                        on_done(chunk)
+                    break
+
+    def warm_up(self, model: Optional[str] = None) -> None:
+        """预加载模型：不带 prompt 的 /api/generate 请求只加载模型并按 keep_alive 常驻"""
+        response = self.session.post(
+            f"{self.base_url}/api/generate",
+            json={"model": model or self.model, "keep_alive": self.keep_alive},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        logger.info(f"Ollama 模型已加载: {model or self.model}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# 进程内共享的 Ollama 客户端
+OLLAMA_CLIENT: Optional[OllamaClient] = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client() -> OllamaClient:
+    """获取（并缓存）进程内共享的 Ollama 客户端"""
+    global OLLAMA_CLIENT
+    with _client_lock:
+        if OLLAMA_CLIENT is None:
+            OLLAMA_CLIENT = OllamaClient()
+    return OLLAMA_CLIENT
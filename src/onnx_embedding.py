@@ -0,0 +1,228 @@
+import argparse
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 嵌入后端："torch"（text2vec / sentence-transformers 原生 PyTorch）或 "onnx"（ONNX Runtime）
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# 导出的 ONNX 模型目录，以及是否使用 int8 动态量化后的模型
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "/home/eddie/models/textmodel-onnx")
+ONNX_QUANTIZED = os.environ.get("ONNX_QUANTIZED", "1") == "1"
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def backend_model_id(model_id: str) -> str:
+    """
+    向量缓存与条文指纹使用的模型标识：不同后端/精度得到的向量不同，标识也必须不同
+    torch 后端保持原标识不变
+    """
+    if EMBEDDING_BACKEND != "onnx":
+        return model_id
+    return f"{model_id}:onnx-{'int8' if ONNX_QUANTIZED else 'fp32'}"
+
+
+def export_onnx_model(model_dir: str, output_dir: str = ONNX_MODEL_DIR, quantize: bool = True) -> str:
+    """
+    将 text2vec-base-chinese（BERT）导出为 ONNX，可选 int8 动态量化
+    输出目录中同时保存分词器，返回实际使用的模型文件路径
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = AutoModel.from_pretrained(model_dir)
+    model.eval()
+
+    sample = tokenizer(["预热文本"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "token_type_ids": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"}
+            },
+            opset_version=14
+        )
+    tokenizer.save_pretrained(output_dir)
+    logger.info(f"ONNX 模型已导出: {fp32_path}")
+
+    if not quantize:
+        return fp32_path
+
+    int8_path = os.path.join(output_dir, INT8_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    logger.info(f"int8 量化模型已导出: {int8_path}")
+    return int8_path
+
+
+class OnnxSentenceModel:
+    """
+    ONNX Runtime 版本的 text2vec 句向量模型
+    与 text2vec.SentenceModel 一致：注意力掩码加权的 mean pooling，encode 接口参数相同
+    """
+
+    def __init__(
+            self,
+            model_dir: str = ONNX_MODEL_DIR,
+            quantized: bool = ONNX_QUANTIZED,
+            max_seq_length: int = 256,
+            intra_op_threads: Optional[int] = None
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+
+    def encode(
+            self,
+            sentences: Union[str, List[str]],
+            batch_size: int = 64,
+            normalize_embeddings: bool = False,
+            **kwargs
+    ) -> "np.ndarray":
+        import numpy as np
+
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            inputs = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feed = {name: inputs[name].astype(np.int64) for name in self.input_names if name in inputs}
+            hidden = self.session.run(None, feed)[0]
+
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled)
+
+        result = np.concatenate(embeddings).astype(np.float32)
+        if normalize_embeddings:
+            result /= np.clip(np.linalg.norm(result, axis=1, keepdims=True), 1e-12, None)
+        return result[0] if single else result
+
+
+def parity_check(
+        torch_model,
+        onnx_model,
+        queries: List[str],
+        corpus: List[str],
+        top_k: int = 10
+) -> Dict[str, float]:
+    """
+    对比 ONNX 与 PyTorch 后端
+    - cosine_mean / cosine_min：同一文本两种后端向量的余弦相似度
+    - topk_overlap：以 corpus 为检索库，两种后端 top-k 结果的平均重合率
+    - speedup：编码 queries + corpus 的耗时比（torch / onnx）
+    """
+    import numpy as np
+
+    texts = queries + corpus
+
+    start = time.perf_counter()
+    torch_vectors = np.asarray(torch_model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    torch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    onnx_vectors = onnx_model.encode(texts, normalize_embeddings=True)
+    onnx_seconds = time.perf_counter() - start
+
+    cosines = (torch_vectors * onnx_vectors).sum(axis=1)
+
+    q_torch, c_torch = torch_vectors[:len(queries)], torch_vectors[len(queries):]
+    q_onnx, c_onnx = onnx_vectors[:len(queries)], onnx_vectors[len(queries):]
+    k = min(top_k, len(corpus))
+    top_torch = np.argsort(-(q_torch @ c_torch.T), axis=1)[:, :k]
+    top_onnx = np.argsort(-(q_onnx @ c_onnx.T), axis=1)[:, :k]
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(top_torch, top_onnx)]
+
+    return {
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "topk_overlap": float(np.mean(overlaps)) if overlaps else 0.0,
+        "top_k": k,
+        "torch_seconds": torch_seconds,
+        "onnx_seconds": onnx_seconds,
+        "speedup": torch_seconds / onnx_seconds if onnx_seconds else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="text2vec ONNX 后端：导出/量化与一致性检查")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出 ONNX 模型（默认同时生成 int8 量化版本）")
+    export_parser.add_argument("--model-dir", default="/home/eddie/models/textmodel", help="text2vec 模型目录")
+    export_parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    export_parser.add_argument("--no-quantize", action="store_true")
+
+    parity_parser = subparsers.add_parser("parity", help="对比 ONNX 与 PyTorch 后端的向量与检索结果")
+    parity_parser.add_argument("--model-dir", default="/home/eddie/models/textmodel", help="text2vec 模型目录")
+    parity_parser.add_argument("--onnx-dir", default=ONNX_MODEL_DIR)
+    parity_parser.add_argument("--fp32", action="store_true", help="对比未量化的 ONNX 模型")
+    parity_parser.add_argument("--records", default=os.path.join("local_index", "crime_documents", "records.json"),
+                               help="本地索引的 records.json，用其中的条文作为检索库")
+    parity_parser.add_argument("--queries", nargs="*", default=[
+        "故意杀人判几年", "正当防卫的条件", "未成年人犯罪如何处罚", "醉酒驾驶机动车", "贪污受贿的量刑标准"
+    ])
+    parity_parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == "export":
+        export_onnx_model(args.model_dir, args.output_dir, quantize=not args.no_quantize)
+        return
+
+    from text2vec import SentenceModel
+
+    with open(args.records, encoding="utf-8") as f:
+        records = json.load(f)["records"]
+    corpus = [record.get("article_content") or record.get("content") or "" for record in records]
+
+    report = parity_check(
+        SentenceModel(args.model_dir),
+        OnnxSentenceModel(args.onnx_dir, quantized=not args.fp32),
+        args.queries,
+        corpus,
+        top_k=args.top_k
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from answer_cache import get_answer_cache
+from article_lookup import is_citation_only
+from context_builder import build_context, count_tokens
+from legal_query_utils import (corpus_version, federated_search, generate_query_vector, lookup_cited_articles,
+                               lookup_cited_articles_federated, query_ollama, query_ollama_stream, search_content)
+from metrics import record_tokens, stage, start_trace
+from ollama_client import OLLAMA_MODEL
+
+logger = logging.getLogger(__name__)
+
+NO_RESULT_CONTEXT = "未找到相关法律信息。"
+
+
+def with_pinned(pinned: List[Dict[str, Any]], search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """引用的条文在前，检索结果中与之重复的条文去掉"""
+    if not pinned:
+        return search_results
+    seen = {(doc.get("index"), doc["id"]) for doc in pinned}
+    return pinned + [doc for doc in search_results if (doc.get("index"), doc["id"]) not in seen]
+
+
+def retrieve_context(
+        query: str,
+        index_name: str = "crime_documents",
+        top_k: int = 20,
+        min_score: float = 10,
+        index_names: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    检索相关条文并构建上下文：按层级分组、标题只出现一次，在 token 预算内按得分装入完整条文
+    问题只是引用条文编号（如“第二百三十二条是什么”）时直接取引用的条文，不做向量编码与检索；
+    引用条文的同时还有其他内容时，引用的条文置于检索结果之前
+    index_names 非空时在多个索引上联合检索（忽略 index_name）
+    """
+    if index_names:
+        pinned = lookup_cited_articles_federated(index_names, query)
+    else:
+        pinned = lookup_cited_articles(index_name, query)
+
+    if pinned and is_citation_only(query):
+        search_results = pinned
+    elif index_names:
+        search_results = with_pinned(pinned, federated_search(index_names, query, top_k=top_k, min_score=min_score))
+    else:
+        search_results = with_pinned(pinned, search_content(
+            index_name=index_name,
+            content_question=query,
+            top_k=top_k,
+            min_score=min_score
+        ))
+    if not search_results:
+        return search_results, NO_RESULT_CONTEXT
+
+    with stage("context_build"):
+        context = build_context(search_results)
+    record_tokens("context", count_tokens(context))
+    return search_results, context
+
+
+def answer_question(
+        query: str,
+        stream: bool = True,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        index_name: str = "crime_documents",
+        top_k: int = 20,
+        min_score: float = 10,
+        model: str = OLLAMA_MODEL,
+        index_names: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """
+    问答主流程（Streamlit 页面与压测工具共用）
+    1. 检索条文并构建上下文
+    2. 近似问题且检索到相同条文时复用已生成的回答（只引用条文的问题不编码问题向量，不查答案缓存）
+    3. 否则调用 Ollama 生成回答；stream=True 时每收到一个片段调用 on_chunk(当前完整回答)
+    返回回答、检索结果、是否命中答案缓存以及本次的各阶段耗时
+    """
+    with start_trace(query) as trace:
+        search_results, context = retrieve_context(query, index_name=index_name, top_k=top_k, min_score=min_score,
+                                                   index_names=index_names)
+
+        pinned_articles = sum(1 for doc in search_results if doc.get("pinned"))
+        citation_only = 0 < pinned_articles == len(search_results) and is_citation_only(query)
+        trace.values["pinned_articles"] = pinned_articles
+        trace.values["citation_only"] = citation_only
+        answer_cache = get_answer_cache()
+        question_vector = None if citation_only else generate_query_vector(query)
+        article_ids = [f"{doc['index']}/{doc['id']}" if "index" in doc else doc["id"] for doc in search_results]
+        version = corpus_version(index_names or [index_name])
+        answer = answer_cache.lookup(question_vector, article_ids, version) if question_vector else None
+        cached = answer is not None
+        trace.values["answer_cache_hit"] = cached
+
+        if answer is None and stream:
+            logger.info("生成回答中...")
+            answer = ""
+            try:
+                for chunk in query_ollama_stream(model=model, prompt=query, context=context):
+                    answer += chunk
+                    if on_chunk is not None:
+                        on_chunk(answer)
+                if question_vector and answer:
+                    answer_cache.store(question_vector, article_ids, answer, version)
+            except Exception as e:
+                answer += f"\n\n回答生成中断: {e}"
+        elif answer is None:
+            logger.info("生成回答中...")
+            result = query_ollama(model=model, prompt=query, context=context)
+            answer = result.get("message", {}).get("content", "未获得有效回答")
+            if question_vector and "message" in result:
+                answer_cache.store(question_vector, article_ids, answer, version)
+
+    return {
+        "answer": answer,
+        "search_results": search_results,
+        "context": context,
+        "cached": cached,
+        "trace": trace
+    }
@@ -0,0 +1,161 @@
+import json
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# WordprocessingML 命名空间
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_BODY, _P, _R, _HYPERLINK = W + "body", W + "p", W + "r", W + "hyperlink"
+# 与 python-docx 的 Run.text 一致：w:t 原文，w:tab/w:ptab 为制表符，w:br（换行）/w:cr 为换行
+_RUN_TEXT = {W + "t": None, W + "tab": "\t", W + "ptab": "\t", W + "br": "\n", W + "cr": "\n",
+             W + "noBreakHyphen": "-"}
+
+_NUM = "[零一二三四五六七八九十百千万]+"
+
+# 刑法：编 / 附则 / 章 / 节 / 条（含“第X条之一”）合并为一个预编译模式，lastgroup 即行类型
+CRIMINAL_LINE = re.compile(
+    rf"^(?:(?P<chapter>第{_NUM}编)\s+.*"
+    r"|(?P<appendix>附\u3000\u3000则)"
+    rf"|(?P<section>第{_NUM}章)\s+.*"
+    rf"|(?P<subsection>第{_NUM}节)\s+.*"
+    rf"|(?P<article>第{_NUM}条(?:之[一二三四五六七八九十]+)?)\s+.*)$"
+)
+
+# 宪法：章 / 序言 / 条
+CONSTITUTION_LINE = re.compile(
+    r"^(?:(?P<chapter>第[一二三四五六七八九十百千万]+章\s+.*)"
+    r"|(?P<preamble>序\u3000\u3000言)"
+    r"|(?P<article>第[一二三四五六七八九十百千万]+条)\s+.*)$"
+)
+PREAMBLE_TITLE = "序\u3000\u3000言"
+
+
+def iter_docx_lines(file_path: str) -> Iterator[str]:
+    """
+    直接从 docx 的 word/document.xml 流式读取正文段落（等价于 python-docx 的 doc.paragraphs），
+    按行拆分并去除首尾空白，跳过空行；已处理完的段落立即释放
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+        stack: List[str] = []
+        parts: List[str] = []
+        body: Optional[ET.Element] = None
+        for event, elem in ET.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                stack.append(elem.tag)
+                if elem.tag == _BODY:
+                    body = elem
+                continue
+
+            stack.pop()
+            tag = elem.tag
+            if tag in _RUN_TEXT and _is_body_run(stack):
+                if tag == W + "t":
+                    parts.append(elem.text or "")
+                elif tag != W + "br" or elem.get(W + "type", "textWrapping") == "textWrapping":
+                    parts.append(_RUN_TEXT[tag])
+            elif len(stack) == 2 and stack[-1] == _BODY:
+                # body 的直接子元素（段落、表格等）处理完毕
+                if tag == _P:
+                    for line in "".join(parts).splitlines():
+                        line = line.strip()
+                        if line:
+                            yield line
+                parts.clear()
+                if body is not None:
+                    body.remove(elem)
+
+
+def _is_body_run(stack: List[str]) -> bool:
+    # 只取正文段落中的 run（含超链接内的 run），不含表格、文本框等嵌套内容
+    return (len(stack) >= 4 and stack[1] == _BODY and stack[2] == _P and stack[-1] == _R
+            and (len(stack) == 4 or (len(stack) == 5 and stack[3] == _HYPERLINK)))
+
+
+def parse_criminal_law(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    逐行解析刑法，每条条文结束时立即产出扁平记录：
+    {chapter_title, sections_title, subsections_title, article_number, article_title, article_content}
+    - 编标题只取“第X编”（附则取整行），章、节、条标题取整行
+    - 条文标题行之后、下一个标题之前的行为条文内容
+    - 没有所属编的章、没有所属章的节视为普通内容行
+    """
+    chapter = section = subsection = None
+    article: Optional[Dict[str, Any]] = None
+    buffer: List[str] = []
+
+    def finish():
+        # 标题之后、第一条之前的内容行不属于任何条文，直接丢弃
+        if article is not None and buffer:
+            article["article_content"] = "\n".join(buffer)
+        buffer.clear()
+        return article
+
+    for line in lines:
+        match = CRIMINAL_LINE.match(line)
+        kind = match.lastgroup if match else None
+
+        if kind == "chapter" or kind == "appendix":
+            if finish():
+                yield article
+            chapter = match.group("chapter") or line
+            section = subsection = article = None
+        elif kind == "section" and chapter is not None:
+            if finish():
+                yield article
+            section, subsection, article = line, None, None
+        elif kind == "subsection" and section is not None:
+            if finish():
+                yield article
+            subsection, article = line, None
+        elif kind == "article":
+            if finish():
+                yield article
+            article = None if chapter is None else {
+                "chapter_title": chapter,
+                "sections_title": section,
+                "subsections_title": subsection,
+                "article_number": match.group("article"),
+                "article_title": line,
+                "article_content": ""
+            }
+        else:
+            buffer.append(line)
+
+    if finish():
+        yield article
+
+
+def parse_constitution(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    逐行解析宪法，产出 {chapter_title, article_number, content}
+    - 序言中的每一行为一条记录，编号“序言N”
+    - 条文只取“第X条”所在行的正文
+    """
+    chapter = None
+    preamble_count = 0
+    for line in lines:
+        match = CONSTITUTION_LINE.match(line)
+        kind = match.lastgroup if match else None
+
+        if kind == "chapter" or kind == "preamble":
+            chapter = line
+            continue
+        if chapter == PREAMBLE_TITLE:
+            preamble_count += 1
+            yield {"chapter_title": chapter, "article_number": f"序言{preamble_count}", "content": line}
+            continue
+        if kind == "article" and chapter is not None:
+            yield {
+                "chapter_title": chapter,
+                "article_number": match.group("article"),
+                "content": line[match.end("article"):].lstrip()
+            }
+
+
+def tee_jsonl(records: Iterable[Dict[str, Any]], path: str) -> Iterator[Dict[str, Any]]:
+    """透传记录，同时逐行写入 JSON Lines 文件"""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            yield record
@@ -0,0 +1,233 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+
+
+class NumpyVectorIndex:
+    """
+    进程内向量检索：所有条文向量保存在一个连续的 float32 矩阵中（可内存映射），
+    行向量预先归一化，查询时一次矩阵乘法即可得到全部余弦相似度
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, records: List[Dict[str, Any]]):
+        if len(ids) != len(vectors) or len(ids) != len(records):
+            raise ValueError("ids、vectors、records 数量不一致")
+        self.ids = ids
+        self.vectors = vectors
+        self.records = records
+        self._positions: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @classmethod
+    def from_documents(
+            cls,
+            documents: Iterable[Tuple[str, Dict[str, Any]]],
+            vector_field: str
+    ) -> "NumpyVectorIndex":
+        """由 (_id, _source) 列表构建，_source 中以 vector 结尾的字段不保存到 records"""
+        ids, rows, records = [], [], []
+        for doc_id, source in documents:
+            vector = source.get(vector_field)
+            if not vector:
+                continue
+            ids.append(doc_id)
+            rows.append(vector)
+            records.append({k: v for k, v in source.items() if not k.endswith("vector")})
+
+        vectors = np.ascontiguousarray(cls._normalize(np.asarray(rows, dtype=np.float32)))
+        return cls(ids, vectors, records)
+
+    def save(self, directory: str) -> None:
+        """保存为 vectors.npy（已归一化的 float32 矩阵）+ records.json"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, VECTORS_FILE), np.asarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(directory, RECORDS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "records": self.records}, f, ensure_ascii=False, separators=(",", ":"))
+        logger.info(f"本地向量索引已保存: {directory}（{len(self)} 条）")
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "NumpyVectorIndex":
+        """加载本地向量索引，mmap=True 时向量矩阵以只读方式内存映射"""
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        with open(os.path.join(directory, RECORDS_FILE), encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], vectors, data["records"])
+
+    def search(
+            self,
+            query_vector: List[float],
+            top_k: int = 10,
+            min_score: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """余弦相似度 top-k 检索，返回与 ES 结果结构一致的字典列表"""
+        if not len(self):
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.vectors @ (query / norm)
+
+        top_k = min(top_k, len(scores))
+        if top_k < len(scores):
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        ranked = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        for idx in ranked:
+            score = float(scores[idx])
+            if min_score is not None and score < min_score:
+                break
+            results.append({"id": self.ids[idx], "score": score, **self.records[idx]})
+        return results
+
+    def similarities(self, query_vector: List[float], ids: Iterable[str]) -> List[Optional[float]]:
+        """指定条文与问题的余弦相似度（不在索引中的 id 为 None），用于给文本检索的结果补上向量相似度"""
+        if self._positions is None:
+            self._positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        positions = [self._positions.get(doc_id) for doc_id in ids]
+        rows = [position for position in positions if position is not None]
+        if norm == 0 or not rows:
+            return [None] * len(positions)
+        scores = iter((self.vectors[np.asarray(rows)] @ (query / norm)).tolist())
+        return [None if position is None else next(scores) for position in positions]
+
+
+class VectorRowWriter:
+    """
+    逐行追加 float32 向量：先写入同目录下的原始二进制文件，close 时按实际行数与维度转换为 .npy
+    内存中不保留向量，入库时内存占用与语料规模无关
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.dim: Optional[int] = None
+        self._raw_path = path + ".rows"
+        self._raw = open(self._raw_path, "wb")
+
+    def append(self, vector: List[float]) -> int:
+        """写入一行，返回行号"""
+        row = np.asarray(vector, dtype=np.float32).ravel()
+        if self.dim is None:
+            self.dim = len(row)
+        elif len(row) != self.dim:
+            raise ValueError(f"向量维度 {len(row)} 与之前的 {self.dim} 不一致")
+        self._raw.write(row.tobytes())
+        self.rows += 1
+        return self.rows - 1
+
+    def close(self, normalize: bool = False, chunk_rows: int = 4096) -> Tuple[int, ...]:
+        """生成 .npy 并删除原始文件，normalize=True 时行向量归一化；返回矩阵形状"""
+        self._raw.close()
+        shape = (self.rows, self.dim or 0)
+        if not self.rows:
+            np.save(self.path, np.zeros(shape, dtype=np.float32))
+        else:
+            source = np.memmap(self._raw_path, dtype=np.float32, mode="r", shape=shape)
+            target = np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=shape)
+            for start in range(0, self.rows, chunk_rows):
+                chunk = source[start:start + chunk_rows]
+                target[start:start + chunk_rows] = NumpyVectorIndex._normalize(chunk) if normalize else chunk
+            target.flush()
+            del source, target
+        os.remove(self._raw_path)
+        return shape
+
+    def abort(self) -> None:
+        self._raw.close()
+        for path in (self._raw_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def tee_local_index(
+        documents: Iterable[Tuple[str, Dict[str, Any]]],
+        directory: str,
+        vector_field: str
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    透传已编码的 (_id, _source)，同时导出本地向量索引：vector_field 逐行写入磁盘（结束时归一化），
+    内存中只保留 ids 与不含向量的 records；全部文档流过后才替换索引文件，中途失败时保留原索引
+    """
+    os.makedirs(directory, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=directory)
+    writer = VectorRowWriter(os.path.join(staging, VECTORS_FILE))
+    ids, records = [], []
+    finished = False
+    try:
+        for doc_id, source in documents:
+            vector = source.get(vector_field)
+            if vector:
+                writer.append(vector)
+                ids.append(doc_id)
+                records.append({k: v for k, v in source.items() if not k.endswith("vector")})
+            yield doc_id, source
+
+        shape = writer.close(normalize=True)
+        with open(os.path.join(staging, RECORDS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "records": records}, f, ensure_ascii=False, separators=(",", ":"))
+        for name in (VECTORS_FILE, RECORDS_FILE):
+            os.replace(os.path.join(staging, name), os.path.join(directory, name))
+        finished = True
+        logger.info(f"本地向量索引已保存: {directory}（{len(ids)} 条，向量 {shape}）")
+    finally:
+        if not finished:
+            writer.abort()
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由刑法 docx（或语料快照）构建本地向量索引")
+    parser.add_argument("--docx", default=os.path.join("data", "Criminal_Law.docx"), help="刑法 docx 文件路径")
+    parser.add_argument("--snapshot", default="",
+                        help="语料快照目录（如 snapshots/crime_documents）；指定时直接使用快照中的向量，不解析 docx")
+    parser.add_argument("--vector-field", default="article_content_vector", help="从快照构建时使用的向量字段")
+    parser.add_argument("--output", default=os.path.join("local_index", "crime_documents"), help="输出目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.snapshot:
+        from corpus_snapshot import CorpusSnapshot
+
+        CorpusSnapshot.load(args.snapshot).to_vector_index(args.vector_field).save(args.output)
+        return
+
+    from ScrapCriminal_law_data import MODEL_ID, iter_article_sources, load_sentence_model
+    from ingest_pipeline import embed_documents
+    from statute_parser import iter_docx_lines, parse_criminal_law
+
+    # 向量优先取自持久化向量缓存，只有未缓存的条文才加载模型编码
+    articles = parse_criminal_law(iter_docx_lines(args.docx))
+    documents = embed_documents(iter_article_sources(articles), load_sentence_model, MODEL_ID)
+    index = NumpyVectorIndex.from_documents(documents, "article_content_vector")
+    index.save(args.output)
+
+
+if __name__ == "__main__":
+    main()